@@ -1,14 +1,22 @@
 import os
-from typing import Dict, List, Type, Union
+from typing import Dict, List, Tuple, Type, Union
 from cornflow_client import ApplicationCore, get_empty_schema
 from cornflow_client.core.tools import load_json
 from .core import Instance, Experiment, Solution, Batch, ZipBatch
-from .solver import Default
+from .solver import Default, RoundRobin, Annealing, Portfolio, CPSat, Polish, LNS
 
 
 class SportsScheduling(ApplicationCore):
     name = "sports_scheduling"
-    solvers = dict(default=Default)
+    solvers = dict(
+        default=Default,
+        round_robin=RoundRobin,
+        annealing=Annealing,
+        portfolio=Portfolio,
+        cpsat=CPSat,
+        polish=Polish,
+        lns=LNS,
+    )
     schema = get_empty_schema(
         properties=dict(
             timeLimit=dict(type="number"),
@@ -18,6 +26,14 @@ class SportsScheduling(ApplicationCore):
             gapAbs=dict(type="number"),
             gapRel=dict(type="number"),
             threads=dict(type="integer"),
+            seed=dict(type="integer"),
+            pattern=dict(type="string"),
+            logPath=dict(type="string"),
+            lnsSlots=dict(type="integer"),
+            lnsTeams=dict(type="integer"),
+            lnsTimeLimit=dict(type="number"),
+            lnsStall=dict(type="integer"),
+            report=dict(type="boolean"),
         ),
         solvers=list(solvers.keys()),
     )
@@ -33,6 +49,53 @@ class SportsScheduling(ApplicationCore):
     def get_solver(self, name: str = "default") -> Union[None, Type[Experiment]]:
         return super().get_solver(name)
 
+    def solve(
+        self, data: dict, config: dict, solution_data: dict = None
+    ) -> Tuple[Dict, str, Dict]:
+        """
+        same as ApplicationCore.solve, but the log also has the log returned
+        by the solver, if any (e.g., the stats of each worker of the portfolio).
+        If config has report=True, the log includes the report of the checks
+        (see Experiment.get_report).
+        """
+        outputs = []
+        get_solver = self.get_solver
+
+        def get_recorded_solver(name: str = "default"):
+            # ApplicationCore.solve only keeps the status of the output of the solver
+            solver_class = get_solver(name)
+            if solver_class is None:
+                return None
+
+            def build(*args):
+                algo = solver_class(*args)
+                solve = algo.solve
+
+                def record(options):
+                    output = solve(options)
+                    outputs.append(output)
+                    return output
+
+                algo.solve = record
+                return algo
+
+            return build
+
+        self.get_solver = get_recorded_solver
+        try:
+            solution, log_txt, log = super().solve(data, config, solution_data)
+        finally:
+            del self.get_solver
+        for output in outputs:
+            if isinstance(output, dict) and output.get("log") is not None:
+                log["log"] = output["log"]
+        if config.get("report") and solution is not None:
+            experiment = Experiment(
+                self.instance.from_dict(data), self.solution.from_dict(solution)
+            )
+            log["report"] = experiment.get_report()
+        return solution, log_txt, log
+
     @property
     def test_cases(self) -> List[Dict]:
         get_file = lambda name: os.path.join(os.path.dirname(__file__), "data", name)
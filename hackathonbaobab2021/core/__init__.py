@@ -1,4 +1,8 @@
 from .instance import Instance
+from .cache import InstanceCache, LogCache, MetricsCache
 from .solution import Solution
 from .experiment import Experiment
+from .index import ConstraintIndex
+from .evaluator import IncrementalEvaluator
+from .dense import DenseSolution, DenseExperiment
 from .batch import Batch, ZipBatch
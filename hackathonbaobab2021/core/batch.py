@@ -2,16 +2,22 @@
 
 from . import experiment as exp
 from . import tools as di
+from .cache import LogCache, MetricsCache
 
-import pytups.tuplist as tl
 import pytups.superdict as sd
 
 import orloge as ol
+import orloge.constants as ol_const
 import os
 import zipfile
 import pandas as pd
 import shutil
 import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+# zip file opened by each worker process of a ZipBatch
+_zipobj = None
 
 
 class Batch(object):
@@ -34,12 +40,28 @@ class Batch(object):
     /PATH/TO/BATCH/instanceY/
     """
 
-    def __init__(self, path, no_scenario=False, scenarios=None, exp_obj=None):
+    def __init__(
+        self,
+        path,
+        no_scenario=False,
+        scenarios=None,
+        exp_obj=None,
+        workers=None,
+        metrics_cache=None,
+        logs_cache=None,
+    ):
         """
 
         :param path: path to results
         :param no_scenario: if True, there is no scenarios, instances directly
         :param scenarios: in order to filter the scenarios to load
+        :param workers: if given, number of processes used to load and evaluate
+            experiments in get_errors and get_objective_function
+        :param metrics_cache: if given, path to a sqlite file (or a MetricsCache)
+            where iter_metrics keeps the metrics of the experiments,
+            so they are only calculated again when the experiment changes
+        :param logs_cache: if given, directory where get_logs keeps the parsed logs.
+            If True, a directory next to the batch (see get_logs_cache)
         """
         self.path = path
         self.cases = None
@@ -49,6 +71,11 @@ class Batch(object):
         self.seeds = None
         self.no_scenario = no_scenario
         self.scenarios = scenarios
+        self.workers = workers
+        if isinstance(metrics_cache, str):
+            metrics_cache = MetricsCache(metrics_cache)
+        self.metrics_cache = metrics_cache
+        self.logs_cache = logs_cache
         if exp_obj is None:
             self.load_experiment = exp.Experiment.from_json
         else:
@@ -79,13 +106,26 @@ class Batch(object):
         if self.cases is not None:
             return self.cases
 
-        load_data = self.load_experiment
-        self.cases = self.get_instances_paths().vapply(load_data)
+        self.cases = sd.SuperDict(self.iter_cases())
         return self.cases
 
+    def iter_cases(self):
+        """
+        yields (key, experiment) for each case.
+        Each experiment is loaded when needed and is not kept in memory.
+        """
+        if self.cases is not None:
+            yield from self.cases.items()
+            return
+        for key, path in self.get_instances_paths().items():
+            yield key, self.load_case(path)
+
+    def load_case(self, path):
+        return self.load_experiment(path)
+
     def get_solver(self):
         opt_info = self.get_options()
-        available_solvers = ["CPLEX", "GUROBI", "CBC"]
+        available_solvers = ["CPLEX", "GUROBI", "CBC", "CPSAT"]
         default = "CPLEX"
         try:
             el = list(opt_info.keys())[0]
@@ -100,23 +140,89 @@ class Batch(object):
             return solver
         # one last try
         for s in available_solvers:
-            if re.search(s, solver):
+            if re.search(s, solver, flags=re.IGNORECASE):
                 return s
         return default
 
-    def get_logs(self, get_progress=False):
+    def get_logs(self, get_progress=False, solver=None):
+        """
+        {key: information in the results.log of the experiment}
+        (see orloge.get_info_solver).
+        Logs are parsed in parallel if self.workers is set
+        and kept in the logs_cache, if any.
+
+        :param get_progress: if True, the progress table of every log is parsed too.
+            To parse it only for some experiments, use get_progress.
+        """
         if self.logs is not None:
             return self.logs
 
-        solver = self.get_solver()
+        self.logs = self.parse_logs(self.get_log_contents(), get_progress, solver)
+        return self.logs
 
-        self.logs = (
+    def get_progress(self, keys=None, solver=None) -> sd.SuperDict:
+        """
+        {key: progress table of the results.log} for the experiments in keys
+        (all by default).
+        """
+        contents = self.get_log_contents()
+        if keys is not None:
+            contents = contents.filter(keys, check=False)
+        return self.parse_logs(contents, True, solver).get_property("progress")
+
+    def get_log_contents(self) -> sd.SuperDict:
+        """
+        {key: content of results.log} for the experiments that have one.
+        """
+
+        def read(path):
+            with open(path, "rb") as f:
+                return f.read()
+
+        return (
             self.get_instances_paths()
             .vapply(lambda v: os.path.join(v, "results.log"))
             .clean(func=os.path.exists)
-            .vapply(lambda v: ol.get_info_solver(v, solver, get_progress=get_progress))
+            .vapply(read)
         )
-        return self.logs
+
+    def get_logs_cache(self):
+        """
+        the LogCache of the batch, or None.
+        """
+        if not self.logs_cache:
+            return None
+        directory = self.logs_cache
+        if directory is True:
+            directory = os.path.splitext(os.path.normpath(self.path))[0] + ".logs"
+        return LogCache(directory)
+
+    def parse_logs(self, contents, get_progress=False, solver=None) -> sd.SuperDict:
+        """
+        parses the logs in contents ({key: content}), only the ones that
+        are not in the logs_cache.
+        """
+        if solver is None:
+            solver = self.get_solver()
+        cache = self.get_logs_cache()
+        parsed = sd.SuperDict()
+        hashes = sd.SuperDict()
+        if cache is not None:
+            hashes = contents.vapply(LogCache.get_key, solver, get_progress)
+            parsed = hashes.vapply(cache.get).clean(func=lambda v: v is not None)
+        missing = contents.kfilter(lambda k: k not in parsed)
+        func = partial(parse_log, solver=solver, get_progress=get_progress)
+        if self.workers and len(missing) > 1:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                chunksize = get_chunksize(len(missing), self.workers)
+                results = executor.map(func, missing.values(), chunksize=chunksize)
+                computed = sd.SuperDict(zip(missing.keys(), results))
+        else:
+            computed = missing.vapply(func)
+        if cache is not None:
+            for key, log in computed.items():
+                cache.set(hashes[key], log)
+        return contents.kapply(lambda k: computed[k] if k in computed else parsed[k])
 
     def get_json(self, name):
         load_data = di.load_data
@@ -129,19 +235,99 @@ class Batch(object):
             .vapply(sd.SuperDict.from_dict)
         )
 
+    def apply_cases(self, func):
+        return sd.SuperDict(self.iter_apply(func))
+
+    def iter_apply(self, func, paths=None):
+        """
+        yields (key, func(experiment)) for each case, without keeping
+        the experiments in memory.
+        If self.workers is set and the cases are not loaded yet, each worker
+        process loads and evaluates its own experiments.
+
+        :param func: a function that takes an experiment. It needs to be picklable
+            (i.e., defined at module level) in order to use workers.
+        :param paths: if given, {key: path} of the cases to use (all by default)
+        """
+        if paths is None:
+            paths = self.get_instances_paths()
+        if self.cases is not None:
+            for key in paths:
+                yield key, func(self.cases[key])
+            return
+        if not self.workers:
+            for key, path in paths.items():
+                yield key, func(self.load_case(path))
+            return
+        if not len(paths):
+            return
+        with self.get_executor() as executor:
+            results = executor.map(
+                self.get_loader(func),
+                paths.values(),
+                chunksize=get_chunksize(len(paths), self.workers),
+            )
+            yield from zip(paths.keys(), results)
+
+    def iter_metrics(self, report=False):
+        """
+        yields (key, dict(objective, errors)) for each case.
+        With a metrics_cache, only the cases that changed are evaluated.
+
+        :param report: if True, the metrics include the report of the checks
+            (see Experiment.get_report)
+        """
+        if self.metrics_cache is None:
+            yield from self.iter_apply(partial(get_metrics, report=report))
+            return
+        cache = self.metrics_cache
+        paths = self.get_instances_paths()
+        keys = paths.kvapply(self.get_content_key)
+        found = cache.get_many(keys.values())
+        missing = paths.kfilter(lambda k: keys[k] not in found)
+        # the cache always keeps the report, so it serves both cases
+        computed = sd.SuperDict(
+            self.iter_apply(partial(get_metrics, report=True), missing)
+        )
+        cache.set_many((keys[key], metrics) for key, metrics in computed.items())
+        for key in paths:
+            metrics = computed.get(key) or found[keys[key]]
+            if not report:
+                metrics = sd.SuperDict(metrics).filter(["objective", "errors"])
+            yield key, dict(metrics)
+
+    def get_content_key(self, key, path) -> str:
+        """
+        hash of the input and output files of the experiment key, in path.
+        """
+        parts = []
+        for name in ["input.json", "output.json"]:
+            filename = os.path.join(path, name)
+            content = b""
+            if os.path.exists(filename):
+                with open(filename, "rb") as f:
+                    content = f.read()
+            parts += [name, content]
+        return MetricsCache.get_key(*parts)
+
+    def get_loader(self, func):
+        """
+        picklable function that takes a path, loads the experiment and applies func.
+        """
+        return partial(_load_and_apply, self.load_experiment, func)
+
+    def get_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.workers)
+
     def get_errors(self):
         if self.errors is not None:
             return self.errors
 
-        self.errors = (
-            self.get_cases()
-            .vapply(lambda v: v.check_solution().to_lendict().values())
-            .vapply(sum)
-        )
+        self.errors = self.apply_cases(get_errors)
         return self.errors
 
     def get_objective_function(self):
-        return self.get_cases().vapply(lambda v: v.get_objective())
+        return self.apply_cases(get_objective)
 
     def get_options(self):
         if self.options is not None:
@@ -199,10 +385,10 @@ class Batch(object):
         master = pd.DataFrame(
             {
                 "sol_code": [
-                    ol.LpSolutionIntegerFeasible,
-                    ol.LpSolutionOptimal,
-                    ol.LpSolutionInfeasible,
-                    ol.LpSolutionNoSolutionFound,
+                    ol_const.LpSolutionIntegerFeasible,
+                    ol_const.LpSolutionOptimal,
+                    ol_const.LpSolutionInfeasible,
+                    ol_const.LpSolutionNoSolutionFound,
                 ],
                 "status": [
                     "IntegerFeasible",
@@ -276,74 +462,154 @@ class ZipBatch(Batch):
         elif ext != zip_ext:
             raise ValueError("Only zip is supported")
         super().__init__(path, *args, **kwargs)
+        self._zipobj = None
+        self._zip_index = None
 
-    def get_instances_paths(self):
-        num_slashes = 2
-        keys_positions = [1, 2]
-        if self.no_scenario:
-            num_slashes = 1
-            keys_positions = 1
-        zipobj = zipfile.ZipFile(self.path)
-        all_files = tl.TupList(di.dirs_in_zip(zipobj))
-        scenario_instances = all_files.vfilter(lambda f: f.count("/") == num_slashes)
-        keys = (
-            scenario_instances.vapply(str.split, "/").vapply(tuple).take(keys_positions)
-        )
-        result_dict = sd.SuperDict(zip(keys, scenario_instances))
-        if self.scenarios:
-            scenarios = set(self.scenarios)
-            return result_dict.kfilter(lambda k: k[0] in scenarios)
-        else:
-            return result_dict
+    def get_zip(self) -> zipfile.ZipFile:
+        """
+        the zip file, opened only once and shared by all accessors.
+        """
+        if self._zipobj is None:
+            self._zipobj = zipfile.ZipFile(self.path)
+        return self._zipobj
 
-    def get_cases(self):
-        if self.cases is not None:
-            return self.cases
+    def close(self) -> None:
+        if self._zipobj is not None:
+            self._zipobj.close()
+            self._zipobj = None
 
-        zipobj = zipfile.ZipFile(self.path)
-        load_data = lambda e: exp.Experiment.from_zipped_json(zipobj, e)
-        self.cases = self.get_instances_paths().vapply(load_data)
-        return self.cases
+    def get_zip_index(self):
+        """
+        reads the names in the zip once and returns two dictionaries:
 
-    def get_logs(self, get_progress=False, solver=None):
-        if self.logs is not None:
-            return self.logs
+        * paths: {key: directory of the experiment}
+        * members: {key: {file name: member name}} for the files
+            directly inside the directory of the experiment
+            (input.json, output.json, options.json, results.log...).
 
-        zipobj = zipfile.ZipFile(self.path)
-        if not solver:
-            solver = self.get_solver()
+        keys are (scenario, instance) or instance if no_scenario.
+        """
+        if self._zip_index is not None:
+            return self._zip_index
+        # the first directory is the batch, then the scenario and the instance
+        depth = 2 if self.no_scenario else 3
+        paths = sd.SuperDict()
+        members = sd.SuperDict()
+        for member in self.get_zip().namelist():
+            parts = member.rstrip("/").split("/")
+            is_dir = member.endswith("/")
+            if len(parts) < depth or (len(parts) == depth and not is_dir):
+                continue
+            key = parts[depth - 1] if self.no_scenario else tuple(parts[1:depth])
+            if key not in paths:
+                paths[key] = "/".join(parts[:depth])
+                members[key] = sd.SuperDict()
+            if len(parts) == depth + 1 and not is_dir:
+                members[key][parts[-1]] = member
+        self._zip_index = paths, members
+        return self._zip_index
+
+    def get_members(self, name) -> sd.SuperDict:
+        """
+        {key: member name} for all experiments that have a file called name.
+        """
+        paths = self.get_instances_paths()
+        _, members = self.get_zip_index()
+        return sd.SuperDict({k: members[k][name] for k in paths if name in members[k]})
 
-        def _read_zip(x):
-            try:
-                return zipobj.read(x)
-            except:
-                return 0
+    def get_instances_paths(self):
+        paths, _ = self.get_zip_index()
+        if self.scenarios:
+            scenarios = set(self.scenarios)
+            return paths.kfilter(lambda k: k[0] in scenarios)
+        else:
+            return paths
 
-        func_to_get_log = ol.get_info_solver
-        filename = "/results.log"
+    def load_case(self, path):
+        return exp.Experiment.from_zipped_json(self.get_zip(), path)
 
-        self.logs = (
-            self.get_instances_paths()
-            .vapply(lambda v: v + filename)
-            .vapply(_read_zip)
-            .clean()
-            .vapply(lambda x: str(x, "utf-8"))
-            .vapply(
-                lambda v: func_to_get_log(
-                    v, solver, get_progress=get_progress, content=True
-                )
-            )
+    def get_content_key(self, key, path) -> str:
+        """
+        hash of the CRC and size of the input and output files of the experiment key.
+        """
+        zipobj = self.get_zip()
+        _, members = self.get_zip_index()
+        parts = []
+        for name in ["input.json", "output.json"]:
+            info = ""
+            if name in members[key]:
+                _info = zipobj.getinfo(members[key][name])
+                info = "{}:{}".format(_info.CRC, _info.file_size)
+            parts += [name, info]
+        return MetricsCache.get_key(*parts)
+
+    def get_loader(self, func):
+        return partial(_load_zipped_and_apply, func)
+
+    def get_executor(self) -> ProcessPoolExecutor:
+        # each worker opens the zip file only once
+        return ProcessPoolExecutor(
+            max_workers=self.workers, initializer=_open_zip, initargs=(self.path,)
         )
-        return self.logs
+
+    def get_log_contents(self) -> sd.SuperDict:
+        return self.get_members("results.log").vapply(self.get_zip().read).clean()
 
     def get_json(self, name):
-        zipobj = zipfile.ZipFile(self.path)
+        zipobj = self.get_zip()
         load_data = lambda v: di.load_data_zip(zipobj=zipobj, path=v)
 
         return (
-            self.get_instances_paths()
-            .vapply(lambda v: v + "/" + name)
+            self.get_members(name)
             .vapply(load_data)
             .clean()
             .vapply(sd.SuperDict.from_dict)
         )
+
+
+def get_errors(experiment) -> int:
+    return sum(experiment.check_solution().to_lendict().values())
+
+
+def get_objective(experiment) -> float:
+    return experiment.get_objective()
+
+
+def get_metrics(experiment, report=False) -> dict:
+    """
+    objective and number of errors of the experiment.
+
+    :param report: if True, it also includes the report of the checks
+        (see Experiment.get_report), from where the rest are calculated
+    """
+    if not report:
+        return dict(objective=get_objective(experiment), errors=get_errors(experiment))
+    checks = experiment.get_report()
+    return dict(
+        objective=sum(r["penalty"] for r in checks if r["type"] == exp.SOFT),
+        errors=sum(r["violations"] for r in checks if r["type"] == exp.HARD),
+        report=checks,
+    )
+
+
+def parse_log(content: bytes, solver: str, get_progress: bool = False) -> dict:
+    return ol.get_info_solver(
+        str(content, "utf-8"), solver, get_progress=get_progress, content=True
+    )
+
+
+def get_chunksize(num_cases: int, workers: int) -> int:
+    return max(1, num_cases // (workers * 4))
+
+
+def _load_and_apply(load_experiment, func, path):
+    return func(load_experiment(path))
+
+
+def _open_zip(path):
+    global _zipobj
+    _zipobj = zipfile.ZipFile(path)
+
+
+def _load_zipped_and_apply(func, path):
+    return func(exp.Experiment.from_zipped_json(_zipobj, path))
@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import tempfile
+import time
+from .constants import CHECKS_VERSION
+
+# change it when the parsed format changes, so old entries are not used
+CACHE_VERSION = "1"
+# maximum number of keys in each sqlite query
+QUERY_SIZE = 500
+
+
+class InstanceCache(object):
+    """
+    On-disk cache of parsed instances.
+    Each entry is keyed by the hash of the content of the source file
+    and stores the data of the Instance as a pickle, so the directory
+    should only be written by us.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def get_key(content: bytes) -> str:
+        return hashlib.sha256(CACHE_VERSION.encode() + content).hexdigest()
+
+    def get_path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".pkl")
+
+    def get(self, key: str):
+        """
+        the cached data, or None if it is not in the cache.
+        """
+        try:
+            with open(self.get_path(key), "rb") as f:
+                return pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def set(self, key: str, data) -> None:
+        # we write to a temporary file first so other processes
+        # never read an incomplete entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.get_path(key))
+
+
+class LogCache(InstanceCache):
+    """
+    On-disk cache of parsed solver logs (see Batch.get_logs).
+    Each entry is keyed by the hash of the log, the solver and
+    whether the progress table was parsed.
+    """
+
+    @staticmethod
+    def get_key(content: bytes, solver: str = "", get_progress: bool = False) -> str:
+        prefix = "{}:{}:".format(solver, int(get_progress)).encode()
+        return InstanceCache.get_key(prefix + content)
+
+
+class MetricsCache(object):
+    """
+    On-disk cache of the metrics of experiments, in a sqlite database.
+    Each entry is keyed by a hash of the content of the experiment and
+    the version of the checks (see get_key) and stores the metrics as json.
+    When there are more than max_entries, the least recently used ones are removed.
+    get_many and set_many read or write many entries in one transaction.
+    """
+
+    def __init__(self, path: str, max_entries: int = 100000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS metrics "
+                "(key TEXT PRIMARY KEY, value TEXT, last_used REAL)"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS metrics_last_used ON metrics (last_used)"
+            )
+
+    @staticmethod
+    def get_key(*parts) -> str:
+        """
+        hash of the parts (bytes or str) that identify the content of an experiment.
+        """
+        key = hashlib.sha256("{}:{}".format(CACHE_VERSION, CHECKS_VERSION).encode())
+        for part in parts:
+            if isinstance(part, str):
+                part = part.encode()
+            # the length avoids collisions between different splits of the same bytes
+            key.update(str(len(part)).encode() + b":" + part)
+        return key.hexdigest()
+
+    def get(self, key: str):
+        """
+        the cached metrics, or None if they are not in the cache.
+        """
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys) -> dict:
+        """
+        {key: metrics} for the keys that are in the cache.
+        """
+        keys = list(keys)
+        unique = list(set(keys))
+        result = dict()
+        for pos in range(0, len(unique), QUERY_SIZE):
+            chunk = unique[pos : pos + QUERY_SIZE]
+            rows = self.connection.execute(
+                "SELECT key, value FROM metrics WHERE key IN ({})".format(
+                    ",".join("?" * len(chunk))
+                ),
+                chunk,
+            )
+            result.update((key, json.loads(value)) for key, value in rows)
+        hits = sum(key in result for key in keys)
+        self.hits += hits
+        self.misses += len(keys) - hits
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                "UPDATE metrics SET last_used = ? WHERE key = ?",
+                [(now, key) for key in result],
+            )
+        return result
+
+    def set(self, key: str, value) -> None:
+        self.set_many([(key, value)])
+
+    def set_many(self, items) -> None:
+        """
+        stores the (key, metrics) in items.
+        """
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO metrics VALUES (?, ?, ?)",
+                [(key, json.dumps(value), now) for key, value in items],
+            )
+            self._evict()
+
+    def _evict(self) -> None:
+        excess = len(self) - self.max_entries
+        if excess <= 0:
+            return
+        self.connection.execute(
+            "DELETE FROM metrics WHERE key IN "
+            "(SELECT key FROM metrics ORDER BY last_used LIMIT ?)",
+            (excess,),
+        )
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM metrics").fetchone()[0]
+
+    def close(self) -> None:
+        self.connection.close()
@@ -7,6 +7,10 @@ HARD = "HARD"
 GLOBAL = "GLOBAL"
 EVERY = "EVERY"
 status = SuperDict({HOME: "home", AWAY: "away"})
+# codes used in the team x slot home_away matrices
+CODES = SuperDict({HOME: 1, AWAY: -1})
+# change it when the result of a check changes, so cached metrics are not used
+CHECKS_VERSION = "2"
 
 C_CLUSTER = SuperDict(
     separation="SeparationConstraints",
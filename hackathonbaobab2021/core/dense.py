@@ -0,0 +1,221 @@
+import numpy as np
+from pytups import SuperDict
+
+from .instance import Instance
+from .solution import Solution
+from .experiment import Experiment, find_breaks
+from .constants import HOME, AWAY, GLOBAL, CODES
+
+
+class DenseSolution(object):
+    """
+    Array representation of a Solution for a given Instance.
+    Teams and slots are indexed by their position in the ConstraintIndex of the instance.
+
+    * rows: (home, away, slot) for each row in the assignment.
+    * home_away: int8 team x slot matrix: 1 (home), -1 (away), 0 (does not play).
+        As in Experiment.team_slot, away overrides home.
+    * opponent: team x slot matrix with the rival of the team (-1 if it does not play).
+    * slot_match: bool slot x match table, with match = home * num_teams + away.
+    """
+
+    def __init__(self, instance: Instance, solution: Solution):
+        index = instance.get_index()
+        self.teams, self.slots = index.teams, index.slots
+        self.team_pos, self.slot_pos = index.team_pos, index.slot_pos
+        num_teams, num_slots = len(self.teams), len(self.slots)
+        self.rows = solution.get_positions(self.team_pos, self.slot_pos)
+        home, away, slot = self.rows.T
+        self.home_away = np.zeros((num_teams, num_slots), dtype=np.int8)
+        self.home_away[home, slot] = CODES[HOME]
+        self.home_away[away, slot] = CODES[AWAY]
+        self.opponent = np.full((num_teams, num_slots), -1, dtype=np.intp)
+        self.opponent[home, slot] = away
+        self.opponent[away, slot] = home
+        self.slot_match = np.zeros((num_slots, num_teams * num_teams), dtype=bool)
+        self.slot_match[slot, home * num_teams + away] = True
+
+    @property
+    def played(self) -> np.ndarray:
+        """
+        bool home x away x slot array
+        """
+        num_teams = len(self.teams)
+        return self.slot_match.reshape(-1, num_teams, num_teams).transpose(1, 2, 0)
+
+    def get_match_slot(self) -> np.ndarray:
+        """
+        home x away matrix with the position of the slot of the match (-1 if not played).
+        As in Solution.get_match_slot, the last row in the assignment wins.
+        """
+        num_teams = len(self.teams)
+        result = np.full((num_teams, num_teams), -1, dtype=np.intp)
+        home, away, slot = self.rows.T
+        result[home, away] = slot
+        return result
+
+    def get_breaks(self) -> np.ndarray:
+        """
+        int8 team x slot matrix with the code of the status (H / A) when the team
+        ends a break (as in Experiment.count_breaks) and 0 otherwise.
+        """
+        return find_breaks(self.home_away)
+
+
+class DenseExperiment(Experiment):
+    """
+    Experiment that runs the checks on a DenseSolution.
+    The results are identical to the ones in Experiment.
+    """
+
+    def __init__(self, instance: Instance, solution: Solution = None):
+        self._dense = None
+        super().__init__(instance, solution)
+
+    @property
+    def solution(self) -> Solution:
+        return super().solution
+
+    @solution.setter
+    def solution(self, value):
+        self._solution = value
+        self._dense = None
+
+    def get_dense(self) -> DenseSolution:
+        """
+        the array representation of the solution.
+        It is cached until a new solution is set.
+        """
+        if self._dense is None:
+            self._dense = DenseSolution(self.instance, self.solution)
+        return self._dense
+
+    def get_home_away(self) -> np.ndarray:
+        return self.get_dense().home_away
+
+    def check_one_match_per_slot(self):
+        dense = self.get_dense()
+        count = np.zeros_like(dense.home_away, dtype=np.intp)
+        home, away, slot = dense.rows.T
+        np.add.at(count, (home, slot), 1)
+        np.add.at(count, (away, slot), 1)
+        teams, slots = np.nonzero(count > 1)
+        return SuperDict(
+            {(dense.slots[s], dense.teams[t]): 1 for t, s in zip(teams, slots)}
+        )
+
+    def check_num_matches(self, mode="home"):
+        dense = self.get_dense()
+        column = 0 if mode == "home" else 1
+        count = np.bincount(dense.rows[:, column], minlength=len(dense.teams))
+        num_matches = len(dense.teams) - 1
+        return SuperDict(
+            {dense.teams[t]: int(v) for t, v in enumerate(count) if v != num_matches}
+        )
+
+    def check_CA1(self, **kwargs):
+        dense = self.get_dense()
+        constraints = self.instance.get_constraint("CA1", **kwargs)
+        index = self.instance.get_index()
+        result = SuperDict()
+        for k, c in constraints.items():
+            compiled = index.get("CA1", k)
+            teams, slots = compiled["teams_pos"], compiled["slots_pos"]
+            value = dense.home_away[np.ix_(teams, slots)] == CODES[c["mode"]]
+            _store_min_max(
+                result,
+                value.astype(int),
+                c,
+                lambda t, s: (k, dense.teams[teams[t]], dense.slots[slots[s]]),
+            )
+        return result
+
+    def check_CA2(self, **kwargs):
+        dense = self.get_dense()
+        played = dense.played
+        constraints = self.instance.get_constraint("CA2", **kwargs)
+        index = self.instance.get_index()
+        result = SuperDict()
+        for k, c in constraints.items():
+            if not len(c["teams2"]) or not len(c["slots"]):
+                continue
+            compiled = index.get("CA2", k)
+            teams1, teams2, slots = (
+                compiled["teams1_pos"],
+                compiled["teams2_pos"],
+                compiled["slots_pos"],
+            )
+            # check_CA2 expands the matches with mode2, i.e., home and away
+            value = played[np.ix_(teams1, teams2, slots)].sum(axis=(1, 2))
+            value += played[np.ix_(teams2, teams1, slots)].sum(axis=(0, 2))
+            _store_min_max(result, value, c, lambda t: (k, dense.teams[teams1[t]]))
+        return result
+
+    def check_CA4(self, level=GLOBAL, **kwargs):
+        dense = self.get_dense()
+        played = dense.played
+        constraints = self.instance.get_constraint("CA4", **kwargs).vfilter(
+            lambda c: c["mode2"] == level
+        )
+        index = self.instance.get_index()
+        result = SuperDict()
+        for k, c in constraints.items():
+            compiled = index.get("CA4", k)
+            teams1, teams2, slots = (
+                compiled["teams1_mask"],
+                compiled["teams2_mask"],
+                compiled["slots_pos"],
+            )
+            # check_CA4 expands the matches with mode2, i.e., home and away
+            mask = np.outer(teams1, teams2) | np.outer(teams2, teams1)
+            value = (played[:, :, slots] & mask[:, :, None]).sum(axis=(0, 1))
+            if level == GLOBAL:
+                if value.sum() - c["max"] > 0:
+                    result[(k,)] = int(value.sum() - c["max"])
+                continue
+            # level == EVERY
+            for s in np.nonzero((value > 0) & (value - c["max"] > 0))[0]:
+                result[k, dense.slots[slots[s]]] = int(value[s] - c["max"])
+        return result
+
+    def check_GA1(self, **kwargs):
+        played = self.get_dense().played
+        constraints = self.instance.get_constraint("GA1", **kwargs)
+        index = self.instance.get_index()
+        result = SuperDict()
+        for k, c in constraints.items():
+            if not len(c["meetings"]) or not len(c["slots"]):
+                continue
+            compiled = index.get("GA1", k)
+            home, away = compiled["meetings_pos"].T
+            value = np.array([played[home, away][:, compiled["slots_pos"]].sum()])
+            _store_min_max(result, value, c, lambda _: (k,))
+        return result
+
+    def check_SE1(self, **kwargs):
+        dense = self.get_dense()
+        match_slot = dense.get_match_slot()
+        constraints = self.instance.get_constraint("SE1", **kwargs)
+        index = self.instance.get_index()
+        result = SuperDict()
+        for k, c in constraints.items():
+            team1, team2 = index.get("SE1", k)["pairs_pos"].T
+            slot1, slot2 = match_slot[team1, team2], match_slot[team2, team1]
+            value = np.abs(slot1 - slot2) - c["min"]
+            for p in np.nonzero((value < 0) & (slot1 >= 0) & (slot2 >= 0))[0]:
+                result[k, dense.teams[team1[p]], dense.teams[team2[p]]] = int(value[p])
+        return result
+
+
+def _store_min_max(result: SuperDict, value: np.ndarray, constraint, get_key) -> None:
+    """
+    stores the deviation of each element in value against the max (positive)
+    or the min (negative) of the constraint, as experiment.compare does with side=None.
+    get_key takes the position of the element and returns its key.
+    """
+    over = value - constraint["max"]
+    under = value - constraint["min"]
+    for pos in zip(*np.nonzero(over > 0)):
+        result[get_key(*pos)] = int(over[pos])
+    for pos in zip(*np.nonzero(under < 0)):
+        result[get_key(*pos)] = int(under[pos])
@@ -0,0 +1,682 @@
+from collections import Counter, defaultdict
+from typing import Iterable, List, Tuple
+from pytups import SuperDict
+
+from .experiment import Experiment, get_sym
+from .solution import Solution
+from .constants import HOME, AWAY, SOFT, HARD, GLOBAL, EVERY
+
+# a move is a pair of lists: the (home, away, slot) rows that are removed
+#  and the (home, away, slot) rows that are added.
+Move = Tuple[List[tuple], List[tuple]]
+
+OWN_CHECKS = ["num_home", "num_away", "one_match_slot"]
+# constraints whose matches are kept in counters
+COUNTED = ["CA2", "CA3", "CA4_global", "CA4_slots", "GA1"]
+
+
+class IncrementalEvaluator(object):
+    """
+    Keeps the violations of each constraint of an Experiment and updates them
+    when the assignment changes.
+
+    Each constraint is split in parts (e.g., a team, a slot or a pair of teams)
+    that are evaluated on their own, see _get_parts.
+    Only the parts that involve the teams and slots changed by a move
+    are evaluated again. The matches counted by CA2, CA3, CA4 and GA1 are kept
+    in counters that change with each match, see _get_count_keys.
+    The values follow the same conventions as
+    Experiment.check_solution and Experiment.get_objective:
+
+    * objective: sum of the penalized SOFT deviations.
+    * infeasibility: number of HARD violations (including the own checks).
+
+    The evaluator assumes each (home, away) match is scheduled at most once,
+    as in any double round-robin.
+    """
+
+    def __init__(self, experiment: Experiment):
+        self.instance = experiment.instance
+        self.slots = list(self.instance.slots)
+        self.slot_pos = {slot: pos for pos, slot in enumerate(self.slots)}
+        self.teams = self.instance.get_teams().keys_tl()
+        self.num_matches = len(self.teams) - 1
+        # constraints and the parts that each team or pair of teams affects
+        self.constraints = self._compile_constraints()
+        # (team, slot position) => parts that a change there affects
+        self.team_parts = defaultdict(set)
+        # (team1, team2) with team1 < team2 => parts that their matches affect
+        self.pair_parts = defaultdict(set)
+        # team => constraints that count the matches of the team
+        self.team_counts = defaultdict(list)
+        # key => function that evaluates it, its arguments and its constraint
+        self.tasks = dict()
+        for (name, k), c in self.constraints.items():
+            func = getattr(self, "_eval_" + name)
+            for part, touch in c["parts"].items():
+                key = name, k, part
+                self.tasks[key] = func, (k, c, part), c
+                if name == "SE1":
+                    self.pair_parts[part].add(key)
+                    continue
+                for team_pos in touch:
+                    self.team_parts[team_pos].add(key)
+            if name in COUNTED:
+                for team in c["touch_teams"]:
+                    self.team_counts[team].append((name, k))
+        for name in ["num_home", "num_away"]:
+            func = getattr(self, "_eval_" + name)
+            for team in self.teams:
+                self.tasks[name, team] = func, (team,), None
+        for slot in self.slots:
+            self.tasks["one_match_slot", slot] = (
+                self._eval_one_match_slot,
+                (slot,),
+                None,
+            )
+        # state of the assignment
+        self.matches = Counter()
+        self.games = defaultdict(list)
+        self.pair_slot = dict()
+        self.num_home = Counter()
+        self.num_away = Counter()
+        # number of distinct matches for each key of _get_count_keys
+        self.counts = Counter()
+        # (CA3 id, team) => number of distinct matches in each slot position
+        self.slot_counts = {
+            (k, team): [0] * len(self.slots)
+            for (name, k), c in self.constraints.items()
+            if name == "CA3"
+            for team in c["parts"]
+        }
+        self._count_keys = dict()
+        # H or A for each team and slot position (None if it does not play)
+        self.team_status = defaultdict(lambda: [None] * len(self.slots))
+        # accumulated homes and breaks of each team, until one of its matches changes
+        self._acc_homes = dict()
+        self._breaks = dict()
+        for row in experiment.solution.get_home_away_slot():
+            self._add(row)
+        # last move evaluated by delta, with its result
+        self._last_delta = None
+        # violations per part (or own check): (errors, objective, infeasibility)
+        self.violations = dict()
+        self.objective = 0
+        self.infeasibility = 0
+        self._update(self.tasks.keys())
+
+    # state handling
+
+    def _add(self, row):
+        home, away, slot = row
+        self.matches[row] += 1
+        if self.matches[row] == 1:
+            keys, slot_keys = self._get_count_keys(row)
+            for key in keys:
+                self.counts[key] += 1
+            for counts, pos in slot_keys:
+                counts[pos] += 1
+        self.games[home, slot].append((home, away))
+        self.games[away, slot].append((home, away))
+        self.pair_slot[home, away] = slot
+        self.num_home[home] += 1
+        self.num_away[away] += 1
+        self._changed(slot, home, away)
+
+    def _remove(self, row):
+        home, away, slot = row
+        if not self.matches[row]:
+            raise ValueError("match {} is not in the assignment".format(row))
+        self.matches[row] -= 1
+        if not self.matches[row]:
+            del self.matches[row]
+            keys, slot_keys = self._get_count_keys(row)
+            for key in keys:
+                self.counts[key] -= 1
+            for counts, pos in slot_keys:
+                counts[pos] -= 1
+        self.games[home, slot].remove((home, away))
+        self.games[away, slot].remove((home, away))
+        if self.pair_slot.get((home, away)) == slot:
+            del self.pair_slot[home, away]
+        self.num_home[home] -= 1
+        self.num_away[away] -= 1
+        self._changed(slot, home, away)
+
+    def _changed(self, slot, *teams):
+        pos = self.slot_pos[slot]
+        for team in teams:
+            status = None
+            for home, away in self.games.get((team, slot), []):
+                # same as Experiment.team_slot: away overrides home
+                status = AWAY if away == team else status or HOME
+            self.team_status[team][pos] = status
+            self._acc_homes.pop(team, None)
+            self._breaks.pop(team, None)
+
+    def _get_count_keys(self, row) -> Tuple[list, list]:
+        """
+        keys of the counters that a (home, away, slot) match adds to:
+
+        * (CA2, k, team): matches of team against its rivals in the slots.
+        * (CA4, k) or, with EVERY, (CA4, k, slot): matches between teams1 and teams2.
+        * (GA1, k): matches of the meetings in the slots.
+
+        and the (slot_counts list, slot position) for CA3:
+        matches of team against its rivals in the mode.
+        """
+        result = self._count_keys.get(row)
+        if result is not None:
+            return result
+        home, away, slot = row
+        pos = self.slot_pos[slot]
+        result = []
+        slot_result = []
+        # a counted match always has its home team among the touched teams
+        for name, k in self.team_counts[home]:
+            c = self.constraints[name, k]
+            if name == "GA1":
+                if (home, away) in c["meetings_set"] and slot in c["slots_set"]:
+                    result.append(("GA1", k))
+                continue
+            set1, set2 = c["set1"], c["set2"]
+            if name == "CA3":
+                if c["mode1"] != AWAY and home in set1 and away in set2:
+                    slot_result.append((self.slot_counts[k, home], pos))
+                if c["mode1"] != HOME and away in set1 and home in set2:
+                    slot_result.append((self.slot_counts[k, away], pos))
+                continue
+            if slot not in c["slots_set"]:
+                continue
+            if name == "CA2":
+                # check_CA2 expands the matches with mode2, i.e., home and away
+                if home in set1 and away in set2:
+                    result.append(("CA2", k, home))
+                if away in set1 and home in set2:
+                    result.append(("CA2", k, away))
+            elif (home in set1 and away in set2) or (home in set2 and away in set1):
+                # CA4 counts each match once
+                result.append(("CA4", k) if name == "CA4_global" else ("CA4", k, slot))
+        self._count_keys[row] = result, slot_result
+        return result, slot_result
+
+    def status(self, team, slot):
+        """
+        H or A for the team in the slot (None if it does not play).
+        Same as Experiment.team_slot: away overrides home.
+        """
+        return self.team_status[team][self.slot_pos[slot]]
+
+    def is_break(self, team, pos):
+        """
+        H or A if the team has a break in the slot in position pos
+        (as in Experiment.count_breaks), None otherwise.
+        """
+        return self.get_breaks(team)[pos]
+
+    def get_breaks(self, team) -> list:
+        """
+        for each slot position, the value of is_break for the team.
+        """
+        result = self._breaks.get(team)
+        if result is None:
+            status = self.team_status[team]
+            result = [None] + [
+                value if value is not None and value != prev else None
+                for prev, value in zip(status, status[1:])
+            ]
+            self._breaks[team] = result
+        return result
+
+    def get_acc_homes(self, team) -> list:
+        """
+        for each slot position, the matches at home of the team until it.
+        """
+        result = self._acc_homes.get(team)
+        if result is None:
+            result = []
+            acc = 0
+            for status in self.team_status[team]:
+                acc += status == HOME
+                result.append(acc)
+            self._acc_homes[team] = result
+        return result
+
+    # constraints
+
+    def _compile_constraints(self) -> dict:
+        """
+        (name, id): constraint with its compiled values from the ConstraintIndex,
+        its parts (see _get_parts) and touch_teams, the teams that can
+        modify its violation.
+        """
+        index = self.instance.get_index()
+        result = dict()
+        for tag in ["CA1", "CA2", "CA3", "CA4", "GA1", "SE1", "BR1", "BR2", "FA2"]:
+            for k, c in self.instance.get_constraint(tag).items():
+                name = tag
+                if tag == "CA4":
+                    if c["mode2"] not in [GLOBAL, EVERY]:
+                        continue
+                    name = "CA4_global" if c["mode2"] == GLOBAL else "CA4_slots"
+                compiled = {**c, **index.get(tag, k)}
+                compiled["penalty"] = self.instance.get_penalty(tag, k)
+                positions = compiled.get("slots_pos", [])
+                compiled["positions"] = frozenset(int(p) for p in positions)
+                if "teams1" in c:
+                    compiled["set1"] = compiled["teams1_set"]
+                    compiled["set2"] = compiled["teams2_set"]
+                    compiled["touch_teams"] = compiled["set1"] | compiled["set2"]
+                elif tag == "GA1":
+                    compiled["touch_teams"] = frozenset(
+                        team for meeting in compiled["meetings_set"] for team in meeting
+                    )
+                else:
+                    compiled["touch_teams"] = compiled.get("teams_set", frozenset())
+                if tag == "CA3":
+                    # the windows of intp slots start in consecutive positions
+                    compiled["starts"] = list(
+                        zip(compiled["windows"].keys(), compiled["starts_pos"].tolist())
+                    )
+                compiled["parts"] = self._get_parts(name, compiled)
+                result[name, k] = compiled
+        return result
+
+    def _get_parts(self, name, c) -> dict:
+        """
+        part of the constraint => (team, slot position) where a change can
+        modify the violation of the part.
+        The parts are the teams (CA1, CA2, CA3, BR1), the slots (CA4_slots)
+        or the pairs of teams (SE1, FA2). The rest have one part, None.
+        The parts of SE1 only change with the matches of their pair of teams.
+        """
+        positions = c["positions"]
+        slot_pos = self.slot_pos
+        touch = lambda teams, positions: {(t, p) for t in teams for p in positions}
+        if name == "CA1":
+            return {team: touch([team], positions) for team in c["teams_set"]}
+        if name == "CA2":
+            if not c["teams2"] or not c["slots"]:
+                return dict()
+            return {team: touch([team], positions) for team in c["set1"]}
+        if name == "CA3":
+            if not len(c["windows"]):
+                return dict()
+            positions = range(len(self.slots))
+            return {team: touch([team], positions) for team in c["set1"]}
+        if name == "CA4_global":
+            return {None: touch(c["touch_teams"], positions)}
+        if name == "CA4_slots":
+            return {
+                slot: touch(c["touch_teams"], [slot_pos[slot]])
+                for slot in c["slots_set"]
+            }
+        if name == "GA1":
+            if not c["meetings"] or not c["slots"]:
+                return dict()
+            return {None: touch(c["touch_teams"], positions)}
+        if name == "SE1":
+            return {pair: None for pair in c["pairs"]}
+        if name in ["BR1", "BR2"]:
+            # a change in a slot changes the breaks of the slot and the next one
+            positions = {p + d for p in positions for d in [-1, 0]}
+            if name == "BR2":
+                return {None: touch(c["touch_teams"], positions)}
+            return {team: touch([team], positions) for team in c["touch_teams"]}
+        # FA2: accumulated homes change from the slot on
+        if not positions:
+            return dict()
+        positions = range(max(positions) + 1)
+        return {pair: touch(pair, positions) for pair in c["pairs"]}
+
+    def _touched(self, rows: Iterable[tuple]) -> set:
+        """
+        keys of the parts of the constraints and own checks affected by a change in rows
+        """
+        team_pos = set()
+        slots = set()
+        pairs = set()
+        for home, away, slot in rows:
+            pos = self.slot_pos[slot]
+            team_pos.add((home, pos))
+            team_pos.add((away, pos))
+            slots.add(slot)
+            pairs.add(get_sym((home, away)))
+        keys = set(("one_match_slot", slot) for slot in slots)
+        for team, pos in team_pos:
+            keys.add(("num_home", team))
+            keys.add(("num_away", team))
+            keys |= self.team_parts.get((team, pos), set())
+        for pair in pairs:
+            keys |= self.pair_parts.get(pair, set())
+        return keys
+
+    def _evaluate(self, key) -> Tuple[dict, int, int]:
+        """
+        violations of one part of a constraint (or own check),
+        its objective and its infeasibility
+        """
+        func, args, c = self.tasks[key]
+        errors = func(*args)
+        if not errors:
+            return errors, 0, 0
+        if c is not None and c["type"] == SOFT:
+            return errors, sum(abs(v) for v in errors.values()) * c["penalty"], 0
+        return errors, 0, len(errors)
+
+    def _evaluate_keys(self, keys: Iterable) -> Tuple[dict, int, int]:
+        """
+        violations of the keys, without storing them,
+        and the change in objective and infeasibility
+        """
+        result = dict()
+        delta_obj = 0
+        delta_inf = 0
+        violations = self.violations
+        for key in keys:
+            errors, obj, inf = result[key] = self._evaluate(key)
+            previous = violations.get(key)
+            if previous is not None:
+                obj -= previous[1]
+                inf -= previous[2]
+            delta_obj += obj
+            delta_inf += inf
+        return result, delta_obj, delta_inf
+
+    def _update(self, keys: Iterable) -> Tuple[int, int]:
+        """
+        evaluates again the keys and returns the change in objective and infeasibility
+        """
+        violations, delta_obj, delta_inf = self._evaluate_keys(keys)
+        self.violations.update(violations)
+        self.objective += delta_obj
+        self.infeasibility += delta_inf
+        return delta_obj, delta_inf
+
+    def _eval_num_home(self, team):
+        value = self.num_home[team]
+        return {team: value} if value != self.num_matches else {}
+
+    def _eval_num_away(self, team):
+        value = self.num_away[team]
+        return {team: value} if value != self.num_matches else {}
+
+    def _eval_one_match_slot(self, slot):
+        return {
+            (slot, team): 1
+            for team in self.teams
+            if len(self.games.get((team, slot), [])) > 1
+        }
+
+    def _eval_CA1(self, k, c, team):
+        result = dict()
+        status = self.team_status[team]
+        for slot in c["slots_set"]:
+            value = status[self.slot_pos[slot]] == c["mode"]
+            _set_min_max(result, (k, team, slot), value, c)
+        return result
+
+    def _eval_CA2(self, k, c, team):
+        result = dict()
+        _set_min_max(result, (k, team), self.counts["CA2", k, team], c)
+        return result
+
+    def _eval_CA3(self, k, c, team):
+        result = dict()
+        # matches until each slot position
+        acc = [0]
+        for count in self.slot_counts[k, team]:
+            acc.append(acc[-1] + count)
+        intp = c["intp"]
+        for start, pos in c["starts"]:
+            value = acc[pos + intp] - acc[pos]
+            if value > c["max"]:
+                result[k, team, start] = value
+        return result
+
+    def _eval_CA4_global(self, k, c, part):
+        value = self.counts["CA4", k]
+        if value - c["max"] > 0:
+            return {(k,): value - c["max"]}
+        return dict()
+
+    def _eval_CA4_slots(self, k, c, slot):
+        value = self.counts["CA4", k, slot]
+        if value and value - c["max"] > 0:
+            return {(k, slot): value - c["max"]}
+        return dict()
+
+    def _eval_GA1(self, k, c, part):
+        result = dict()
+        _set_min_max(result, (k,), self.counts["GA1", k], c)
+        return result
+
+    def _eval_SE1(self, k, c, pair):
+        team1, team2 = pair
+        slot1 = self.pair_slot.get((team1, team2))
+        slot2 = self.pair_slot.get((team2, team1))
+        if slot1 is None or slot2 is None:
+            return dict()
+        value = abs(self.slot_pos[slot1] - self.slot_pos[slot2]) - c["min"]
+        if value < 0:
+            return {(k, team1, team2): value}
+        return dict()
+
+    def _eval_BR1(self, k, c, team):
+        modes = [c["mode2"]] if c["mode2"] in [AWAY, HOME] else [HOME, AWAY]
+        breaks = self.get_breaks(team)
+        value = sum(breaks[pos] in modes for pos in c["positions"])
+        if value - c["intp"] > 0:
+            return {(k, team): value - c["intp"]}
+        return dict()
+
+    def _eval_BR2(self, k, c, part):
+        value = 0
+        for team in c["touch_teams"]:
+            breaks = self.get_breaks(team)
+            value += sum(breaks[pos] is not None for pos in c["positions"])
+        if value - c["intp"] > 0:
+            return {k: value - c["intp"]}
+        return dict()
+
+    def _eval_FA2(self, k, c, pair):
+        team1, team2 = pair
+        acc1, acc2 = self.get_acc_homes(team1), self.get_acc_homes(team2)
+        value = max(abs(acc1[p] - acc2[p]) for p in c["positions"])
+        if value - c["intp"] > 0:
+            # check_FA2 keeps the pair of teams as one element of the key
+            return {(k, (team1, team2)): value - c["intp"]}
+        return dict()
+
+    # moves
+
+    def swap_slots(self, slot1, slot2) -> Move:
+        """
+        all matches in slot1 go to slot2 and vice versa.
+        """
+        removed = [
+            (home, away, slot)
+            for slot in {slot1, slot2}
+            for team in self.teams
+            for home, away in self.games.get((team, slot), [])
+            if home == team
+        ]
+        other = {slot1: slot2, slot2: slot1}
+        added = [(home, away, other[slot]) for home, away, slot in removed]
+        return removed, added
+
+    def swap_home_away(self, home, away) -> Move:
+        """
+        the match (home, away) is played as (away, home) and the return match
+        (if scheduled) as (home, away), keeping both slots.
+        """
+        slot = self.pair_slot[home, away]
+        removed = [(home, away, slot)]
+        added = [(away, home, slot)]
+        if (away, home) in self.pair_slot:
+            slot2 = self.pair_slot[away, home]
+            removed.append((away, home, slot2))
+            added.append((home, away, slot2))
+        return removed, added
+
+    def game(self, team, slot):
+        """
+        the (home, away) match of the team in the slot (None if it does not play).
+        """
+        games = self.games.get((team, slot))
+        if not games:
+            return None
+        return games[0]
+
+    def swap_teams(self, team1, team2) -> Move:
+        """
+        team1 plays the matches of team2 and vice versa,
+        except the matches between them, that stay the same.
+        """
+        other = {team1: team2, team2: team1}
+        rename = lambda team: other.get(team, team)
+        removed = [
+            (home, away, slot)
+            for slot in self.slots
+            for team in [team1, team2]
+            for home, away in self.games.get((team, slot), [])
+            if {home, away} != {team1, team2}
+        ]
+        added = [(rename(home), rename(away), slot) for home, away, slot in removed]
+        return removed, added
+
+    def partial_swap_slots(self, team, slot1, slot2) -> Move:
+        """
+        the matches of team in slot1 and slot2 are swapped, and so are the
+        matches needed to keep every team playing once per slot.
+        """
+        teams = {team}
+        pending = [team]
+        while pending:
+            current = pending.pop()
+            for slot in [slot1, slot2]:
+                for home, away in self.games.get((current, slot), []):
+                    for rival in [home, away]:
+                        if rival not in teams:
+                            teams.add(rival)
+                            pending.append(rival)
+        removed = [
+            (home, away, slot)
+            for slot in {slot1, slot2}
+            for t in teams
+            for home, away in self.games.get((t, slot), [])
+            if home == t
+        ]
+        other = {slot1: slot2, slot2: slot1}
+        added = [(home, away, other[slot]) for home, away, slot in removed]
+        return removed, added
+
+    def partial_swap_teams(self, team1, team2, slot):
+        """
+        team1 and team2 exchange their matches in slot, and in the slots needed
+        to keep every pair of teams meeting once at home and once away.
+        Returns None if it is not possible (the teams meet in one of those slots).
+        """
+        rival_venue = lambda t, m: (m[1], HOME) if m[0] == t else (m[0], AWAY)
+        slots = set()
+        pending = [slot]
+        while pending:
+            current = pending.pop()
+            if current in slots:
+                continue
+            game1, game2 = self.game(team1, current), self.game(team2, current)
+            if game1 is None or game2 is None or game1 == game2:
+                return None
+            slots.add(current)
+            # team1 now plays the match of team2: its previous match
+            # against the same rival, in the same venue, needs to be swapped too
+            target = rival_venue(team2, game2)
+            for other in self.slots:
+                game = self.game(team1, other)
+                if game is not None and rival_venue(team1, game) == target:
+                    pending.append(other)
+        removed = []
+        added = []
+        for current in slots:
+            game1, game2 = self.game(team1, current), self.game(team2, current)
+            removed += [(*game1, current), (*game2, current)]
+            added += [
+                tuple(team2 if t == team1 else t for t in game1) + (current,),
+                tuple(team1 if t == team2 else t for t in game2) + (current,),
+            ]
+        return removed, added
+
+    def move_match(self, home, away, slot) -> Move:
+        """
+        the match (home, away) is played in slot.
+        """
+        return [(home, away, self.pair_slot[home, away])], [(home, away, slot)]
+
+    def _apply(self, move: Move) -> set:
+        removed, added = move
+        for row in removed:
+            self._remove(row)
+        for row in added:
+            self._add(row)
+        return self._touched(list(removed) + list(added))
+
+    def apply(self, move: Move) -> Tuple[int, int]:
+        """
+        applies the move and returns the change in objective and infeasibility.
+        If the move is the last one passed to delta, its evaluation is reused.
+        """
+        last, self._last_delta = self._last_delta, None
+        if last is None or last[0] is not move:
+            return self._update(self._apply(move))
+        _, violations, delta_obj, delta_inf = last
+        self._apply(move)
+        self.violations.update(violations)
+        self.objective += delta_obj
+        self.infeasibility += delta_inf
+        return delta_obj, delta_inf
+
+    def delta(self, move: Move) -> Tuple[int, int]:
+        """
+        returns the change in objective and infeasibility of the move
+        without applying it.
+        """
+        removed, added = move
+        violations, delta_obj, delta_inf = self._evaluate_keys(self._apply(move))
+        self._last_delta = move, violations, delta_obj, delta_inf
+        # we undo the move
+        self._apply((added, removed))
+        return delta_obj, delta_inf
+
+    # exports
+
+    def check_solution(self, c_type=HARD) -> SuperDict:
+        """
+        same format as Experiment.check_solution for the current assignment
+        """
+        result = SuperDict()
+        for key, (errors, obj, inf) in self.violations.items():
+            name, k = key[:2]
+            if name in OWN_CHECKS:
+                if c_type != HARD:
+                    continue
+            elif self.constraints[name, k]["type"] != c_type:
+                continue
+            result.setdefault(name, SuperDict()).update(errors)
+        return result.vfilter(lambda v: len(v))
+
+    def get_objective(self) -> float:
+        return self.objective
+
+    def get_solution(self) -> Solution:
+        return Solution.from_rows(self.matches.elements())
+
+
+def _set_min_max(result: dict, key, value, constraint) -> None:
+    """
+    stores the deviation of value against the max (positive) or the min (negative)
+    of the constraint, as experiment.compare does with side=None.
+    """
+    if value - constraint["max"] > 0:
+        result[key] = value - constraint["max"]
+    if value - constraint["min"] < 0:
+        result[key] = value - constraint["min"]
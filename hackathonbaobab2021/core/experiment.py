@@ -6,20 +6,23 @@ from zipfile import ZipFile
 from typing import List, Union, Any
 from cornflow_client import ExperimentCore
 import xml.etree.ElementTree as ET
-from .tools import indent
+from .tools import indent, popcount
 from pytups import SuperDict, TupList
 from functools import partial
+from timeit import default_timer as timer
+import numpy as np
 
-from itertools import combinations
-from .constants import HOME, AWAY, SOFT, HARD, GLOBAL, EVERY, status
+from .constants import HOME, AWAY, SOFT, HARD, GLOBAL, EVERY, CODES, status
 
 
 class Experiment(ExperimentCore):
     def __init__(self, instance: Instance, solution: Solution = None):
         super().__init__(instance, solution)
         if solution is None:
-            solution = Solution(SuperDict(assignment=TupList()))
+            solution = Solution.from_rows([])
         self.solution = solution
+        # when it's a list, each check run by check_solution is recorded in it
+        self._profile = None
         return
 
     @property
@@ -84,16 +87,81 @@ class Experiment(ExperimentCore):
         )
         if list_tests is not None:
             official_checks = official_checks.filter(indices=list_tests)
-        checks = official_checks.vapply(lambda v: v(c_type=c_type, **params))
+        checks = official_checks.kvapply(
+            lambda k, v: self._run_check(k, partial(v, c_type=c_type, **params), c_type)
+        )
         own_checks = dict()
         if c_type == HARD:
             own_checks = SuperDict(
-                num_away=self.check_num_matches("away"),
-                num_home=self.check_num_matches("home"),
-                one_match_slot=self.check_one_match_per_slot(),
-            )
+                num_away=partial(self.check_num_matches, "away"),
+                num_home=partial(self.check_num_matches, "home"),
+                one_match_slot=self.check_one_match_per_slot,
+            ).kvapply(lambda k, v: self._run_check(k, v, c_type))
         return checks._update(own_checks).vfilter(lambda v: len(v))
 
+    def _run_check(self, name, func, c_type):
+        """
+        runs the check func (without arguments) and, if we are profiling, records it.
+        """
+        if self._profile is None:
+            return func()
+        start = timer()
+        result = func()
+        elapsed = timer() - start
+        tag = name.split("_")[0]
+        if tag in ["num", "one"]:
+            # own checks: one per team or one per slot
+            constraints = len(self.instance.slots)
+            if tag == "num":
+                constraints = len(self.instance.get_teams())
+            penalty = 0
+        else:
+            constraints = len(self.instance.get_constraint(tag, c_type=c_type))
+            if tag == "CA4":
+                level = EVERY if name == "CA4_slots" else GLOBAL
+                constraints = len(
+                    self.instance.get_constraint(tag, c_type=c_type).vfilter(
+                        lambda c: c["mode2"] == level
+                    )
+                )
+            get_id = lambda k: k[0] if isinstance(k, tuple) else k
+            penalty = 0
+            if c_type == SOFT:
+                penalty = sum(
+                    abs(v) * self.instance.get_penalty(tag, get_id(k))
+                    for k, v in result.items()
+                )
+        self._profile.append(
+            dict(
+                check=name,
+                type=c_type,
+                time=elapsed,
+                constraints=constraints,
+                violations=len(result),
+                penalty=penalty,
+            )
+        )
+        return result
+
+    def get_report(self, list_tests: List[str] = None) -> TupList:
+        """
+        runs the HARD and the SOFT checks and returns, for each one, a dict with:
+
+        * check: name of the check (as in check_solution).
+        * type: HARD or SOFT.
+        * time: seconds it took.
+        * constraints: number of constraints evaluated.
+        * violations: number of violations.
+        * penalty: contribution to get_objective (0 for HARD checks).
+        """
+        self._profile = TupList()
+        try:
+            self.check_solution(list_tests, c_type=HARD)
+            self.check_solution(list_tests, c_type=SOFT)
+            return self._profile
+        finally:
+            self._profile = None
+
     def check_one_match_per_slot(self):
         """
         returns the (slot, team) combinations where the team plays more than once
@@ -140,29 +208,24 @@ class Experiment(ExperimentCore):
         team and team2 in T
         (c, team, team2): max(difference in accumulated homes in slots in S) <= intp
         """
-        acc_homes = self.get_acc(check=HOME)
+        # for each team and slot, the homes until the slot
+        acc_homes = np.cumsum(self.get_home_away() == CODES[HOME], axis=1)
         constraints = self.instance.get_constraint("FA2", **kwargs)
+        index = self.instance.get_index()
         err = SuperDict()
         for k, c in constraints.items():
-
-            def max_diff_acc_homes(team1, team2):
-                return max(
-                    abs(acc_homes[team1, slot] - acc_homes[team2, slot])
-                    for slot in c["slots"]
-                )
-
-            # we get all combinations, and re-arrange so team1 < team2.
-            # then we calculate the max diff among all slots
-            # then compare with maximum
-            # then we filter those that surpass
-            err[k] = (
-                TupList(combinations(c["teams"], 2))
-                .vapply(get_sym)
-                .to_dict(None)
-                .vapply(lambda v: max_diff_acc_homes(*v) - c["intp"])
-                .vfilter(lambda v: v > 0)
-            )
-        return err.vfilter(lambda v: len(v)).to_dictup()
+            compiled = index.get("FA2", k)
+            # all combinations of teams, arranged so team1 < team2
+            pairs, (team1, team2) = compiled["pairs"], compiled["pairs_pos"].T
+            if not len(pairs) or not len(compiled["slots_pos"]):
+                continue
+            # the max diff among all slots, compared with the maximum
+            acc = acc_homes[:, compiled["slots_pos"]]
+            diff = np.abs(acc[team1] - acc[team2]).max(axis=1) - c["intp"]
+            # we keep the pairs that surpass it
+            for p in np.nonzero(diff > 0)[0]:
+                err[k, pairs[p]] = int(diff[p])
+        return err
 
     def check_CA1(self, **kwargs):
         """
@@ -184,17 +247,18 @@ class Experiment(ExperimentCore):
         """
         (c, team) : min <= sum(matches by teams T and R rivals in mode M during slots S) <= max
         """
-        matches = self.solution.get_home_away_slot().to_set()
         constraints = self.instance.get_constraint("CA2", **kwargs)
+        index = self.instance.get_index()
+        matches = index.to_bits(self.solution.get_home_away_slot())
         # we index by constraint and team1
-        # we apply the mode to expand or move the home away
+        # the index already has the matches with the mode applied
         # we intersect with the solution and get the number of finds
-        value = (
-            constraints.vapply(get_matches_slots_constraint)
-            .to_tuplist()
-            .to_dict(result_col=[1, 2, 3], indices=[0, 1])
-            .kvapply(lambda k, v: apply_mode(v, mode=constraints[k[0]]["mode2"]))
-            .vapply(lambda v: v.intersect(matches).len())
+        value = SuperDict(
+            {
+                (k, team): popcount(check & matches)
+                for k in constraints
+                for team, check in index.get("CA2", k)["matches_bits"].items()
+            }
         )
         return compare(value, constraints, side=None)
 
@@ -202,34 +266,32 @@ class Experiment(ExperimentCore):
         """
         for each (c, team, slot) => sum(matches with R rivals in next S slots in mode M) <= max
         """
-        matches = self.solution.get_home_away_slot().to_set()
         constraints = self.instance.get_constraint("CA3", **kwargs)
-        all_slots = self.instance.slots
+        index = self.instance.get_index()
+        home, away, slot = self.get_match_positions().T
         value = SuperDict()
         for k, c in constraints.items():
-            # for each slot, we want c["intp"] consecutive slots:
-            slot_slots = TupList(
-                (start, slot)
-                for pos, start in enumerate(all_slots[: -c["intp"] + 1])
-                for slot in all_slots[pos : pos + c["intp"]]
-            ).to_dict(result_col=1)
-            # for each team and slot, we get all matches and slots to check
-            check = {
-                (team, start): [
-                    (team, rival, slot) for rival in c["teams2"] for slot in slots
-                ]
-                for team in c["teams1"]
-                for start, slots in slot_slots.items()
-            }
-            # we order the matches and compare it with the solution, only store violations
-            value[k] = (
-                SuperDict(check)
-                .vapply(TupList)
-                .vapply(apply_mode, mode=c["mode1"])
-                .vapply(lambda v: v.intersect(matches).len())
-                .vfilter(lambda v: v > c["max"])
-            )
-        return value.to_dictdict().to_dictup()
+            compiled = index.get("CA3", k)
+            teams1, teams2 = compiled["teams1_mask"], compiled["teams2_mask"]
+            # for each team and slot, the matches with the rivals in the mode
+            count = np.zeros((len(index.teams), len(index.slots)), dtype=np.intp)
+            if c["mode1"] != AWAY:
+                found = teams1[home] & teams2[away]
+                np.add.at(count, (home[found], slot[found]), 1)
+            if c["mode1"] != HOME:
+                found = teams1[away] & teams2[home]
+                if c["mode1"] != AWAY:
+                    # a match against itself is only counted once
+                    found &= home != away
+                np.add.at(count, (away[found], slot[found]), 1)
+            # for each team and start slot, the matches in the c["intp"] slots
+            teams = compiled["teams1_pos"]
+            starts = compiled["windows"].keys_tl()
+            sums = window_sums(count[teams], c["intp"])[:, compiled["starts_pos"]]
+            # we only store violations
+            for t, s in zip(*np.nonzero(sums > c["max"])):
+                value[k, index.teams[teams[t]], starts[s]] = int(sums[t, s])
+        return value
 
     def check_CA4(self, level=GLOBAL, **kwargs):
         """
@@ -238,25 +300,26 @@ class Experiment(ExperimentCore):
         if level == EVERY:
             (c, slot) : sum(matches by all teams in T with R rivals in mode M) <= max
         """
-        matches = self.solution.get_home_away_slot().to_set()
         constraints = self.instance.get_constraint("CA4", **kwargs).vfilter(
             lambda c: c["mode2"] == level
         )
-
-        def _func(constraint):
-            tuplist = get_matches_slots_constraint(constraint)
-            return apply_mode(tuplist, mode=constraint["mode2"]).to_set()
+        index = self.instance.get_index()
+        matches = index.to_bits(self.solution.get_home_away_slot())
+        _func = lambda k: index.get("CA4", k)["matches_bits"] & matches
 
         if level == GLOBAL:
-            value = {(k,): len(_func(c) & matches) for k, c in constraints.items()}
+            value = {(k,): popcount(_func(k)) for k in constraints}
         else:
             # level == EVERY
-            value = {k: TupList(_func(c) & matches) for k, c in constraints.items()}
-            value = (
-                SuperDict(value)
-                .vapply(lambda v: v.to_dict(result_col=[0, 1]).to_lendict())
-                .to_dictup()
-            )
+            slot_bits = index.get_slot_bits()
+            value = dict()
+            for k, c in constraints.items():
+                found = _func(k)
+                for slot in c["slots"]:
+                    count = popcount(found & slot_bits[slot])
+                    # we only count slots with matches
+                    if count:
+                        value[k, slot] = count
         return compare(SuperDict(value), constraints, "max")
 
     def check_GA1(self, **kwargs):
@@ -264,14 +327,15 @@ class Experiment(ExperimentCore):
         (c, ): min <= sum(matches in M in mode M) <= max
         """
         constraints = self.instance.get_constraint("GA1", **kwargs)
-        tup_list = self.solution.get_home_away_slot()
-        value = {
-            (k,): (*match, slot)
-            for k, c in constraints.items()
-            for match in c["meetings"]
-            for slot in c["slots"]
-        }
-        value = SuperDict(value).vapply(lambda v: tup_list.intersect(value).len())
+        index = self.instance.get_index()
+        matches = index.to_bits(self.solution.get_home_away_slot())
+        value = SuperDict(
+            {
+                (k,): popcount(index.get("GA1", k)["matches_bits"] & matches)
+                for k, c in constraints.items()
+                if len(c["meetings"]) and len(c["slots"])
+            }
+        )
         return compare(value, constraints, side=None)
 
     def check_SE1(self, **kwargs):
@@ -279,10 +343,11 @@ class Experiment(ExperimentCore):
         (c, team1, team2): distance between matches >= min
         """
         constraints = self.instance.get_constraint("SE1", **kwargs)
+        index = self.instance.get_index()
         value = SuperDict()
         _dist = self.instance.slots.dist
         for k, c in constraints.items():
-            pairs = TupList(combinations(c["teams"], 2)).vapply(get_sym)
+            pairs = index.get("SE1", k)["pairs"]
             value[k] = (
                 self.solution.get_pair_slots().filter(pairs).vapply(lambda v: _dist(*v))
             )
@@ -292,39 +357,67 @@ class Experiment(ExperimentCore):
         """
         (c, team) : sum(breaks of team in slots in S, modes in M) <= intp
         """
-        # raise NotImplementedError("we need to index by team")
-        breaks_per_team = (
-            self.count_breaks().to_tuplist().to_dict(result_col=[1, 2]).vapply(set)
-        )
         constraints = self.instance.get_constraint("BR1", **kwargs)
+        index = self.instance.get_index()
+        breaks = self.get_breaks()
         value = SuperDict()
         for k, c in constraints.items():
+            compiled = index.get("BR1", k)
+            teams, slots = compiled["teams_pos"], compiled["slots_pos"]
+            selected = breaks[np.ix_(teams, slots)]
             if c["mode2"] in [AWAY, HOME]:
-                modes = [c["mode2"]]
-            else:  #  c["mode1"] == "HA"
-                modes = [HOME, AWAY]
-            check = TupList(
-                (slot, mode) for slot in c["slots"] for mode in modes
-            ).to_set()
-            value[k] = {
-                team: len((check & breaks_per_team[team])) - c["intp"]
-                for team in c["teams"]
-            }
-        value = value.to_dictup()
-        return value.vfilter(lambda v: v > 0)
+                count = (selected == CODES[c["mode2"]]).sum(axis=1)
+            else:  #  c["mode2"] == "HA"
+                count = (selected != 0).sum(axis=1)
+            for t in np.nonzero(count > c["intp"])[0]:
+                value[k, index.teams[teams[t]]] = int(count[t] - c["intp"])
+        return value
 
     def check_BR2(self, **kwargs):
         """
         (c, ): sum(breaks of teams T in slots S) <= intp
         """
-        breaks = self.count_breaks()
         constraints = self.instance.get_constraint("BR2", **kwargs)
-        value = {
-            k: breaks.kfilter(lambda v: v[0] in c["teams"] and v[1] in c["slots"]).len()
-            - c["intp"]
-            for k, c in constraints.items()
-        }
-        return SuperDict(value).vfilter(lambda v: v > 0)
+        index = self.instance.get_index()
+        breaks = self.get_breaks() != 0
+        value = SuperDict()
+        for k, c in constraints.items():
+            compiled = index.get("BR2", k)
+            # the number of breaks in the rows of teams and the columns of slots
+            count = breaks[compiled["teams_mask"]][:, compiled["slots_mask"]].sum()
+            if count > c["intp"]:
+                value[k] = int(count - c["intp"])
+        return value
+
+    def get_home_away(self) -> np.ndarray:
+        """
+        int8 team x slot matrix (in the positions of the ConstraintIndex)
+        with 1 if the team plays at home, -1 if it plays away and 0 if it does not play.
+        As in team_slot, away overrides home.
+        """
+        index = self.instance.get_index()
+        result = np.zeros((len(index.teams), len(index.slots)), dtype=np.int8)
+        home, away, slot = self.solution.get_positions(index.team_pos, index.slot_pos).T
+        result[home, slot] = CODES[HOME]
+        result[away, slot] = CODES[AWAY]
+        return result
+
+    def get_match_positions(self) -> np.ndarray:
+        """
+        array with the (home, away, slot) positions (in the ConstraintIndex)
+        of the different matches of the solution.
+        """
+        index = self.instance.get_index()
+        rows = self.solution.get_positions(index.team_pos, index.slot_pos)
+        return np.unique(rows, axis=0)
+
+    def get_breaks(self) -> np.ndarray:
+        """
+        int8 team x slot matrix (in the positions of the ConstraintIndex)
+        with the code of the status (see get_home_away) when the team ends a break
+        and 0 otherwise. The same breaks as count_breaks.
+        """
+        return find_breaks(self.get_home_away())
 
     def count_breaks(self):
         """
@@ -434,6 +527,32 @@ def compare(_dict: SuperDict[Any, int], constraints, side: Union[str, None] = "m
     )
 
 
+def find_breaks(home_away: np.ndarray) -> np.ndarray:
+    """
+    int8 team x slot matrix with the code of the status (H / A) when the team
+    ends a break and 0 otherwise.
+    As in Experiment.count_breaks, a team that plays after a slot
+    without playing also ends a break.
+
+    :param home_away: int8 team x slot matrix (see DenseSolution.home_away)
+    """
+    result = np.zeros_like(home_away)
+    changed = (home_away[:, 1:] != 0) & (home_away[:, 1:] != home_away[:, :-1])
+    result[:, 1:] = np.where(changed, home_away[:, 1:], 0)
+    return result
+
+
+def window_sums(values: np.ndarray, intp: int) -> np.ndarray:
+    """
+    for each row of values and each position p, the sum of values[:, p : p + intp].
+    Only positions where the whole window fits are returned.
+    It's calculated as the difference of two cumulative sums.
+    """
+    acc = np.zeros((values.shape[0], values.shape[1] + 1), dtype=np.intp)
+    np.cumsum(values, axis=1, out=acc[:, 1:])
+    return acc[:, intp:] - acc[:, : max(acc.shape[1] - intp, 0)]
+
+
 def get_sym(pair):
     """
     reformats a tuple of (team, rival) so that the first element is smaller than the other
@@ -0,0 +1,167 @@
+import numpy as np
+from itertools import combinations
+from pytups import SuperDict, TupList
+
+from .experiment import get_sym, apply_mode, get_matches_slots_constraint
+from .constants import C_CAT
+
+TEAM_FIELDS = ["teams", "teams1", "teams2"]
+
+
+class ConstraintIndex(object):
+    """
+    Everything about the constraints of an Instance that does not depend on the solution.
+    It is built once per instance (see Instance.get_index) and reused by all checkers.
+
+    * teams / slots: ids in the order used for positions (slots follow Instance.slots).
+    * team_pos / slot_pos: id => integer position.
+    * constraints: {tag: {id: compiled constraint}}. For each compiled constraint,
+        and each of its team fields (teams, teams1, teams2) and slots:
+
+        * <field>_pos: sorted array of unique positions.
+        * <field>_mask: bool membership mask over all teams (or slots).
+        * <field>_set: frozenset of ids.
+
+        Besides, depending on the category:
+
+        * CA2: matches_bits: {team: bitset of the (team, rival, slot) to look for}.
+        * CA3: windows: {start slot: slots in the sequence of intp slots}
+            and starts_pos, the positions of the start slots.
+        * CA4: matches_bits: bitset of the (team, rival, slot) to look for.
+        * GA1: matches_bits: bitset of the (home, away, slot) to look for,
+            meetings_set: frozenset of (home, away) and meetings_pos, the same
+            meetings as an array of positions.
+        * SE1, FA2: pairs: TupList of (team1, team2) with team1 < team2
+            and pairs_pos, the same pairs as an array of positions.
+
+    A bitset is an int with one bit per (home, away, slot), see get_bit.
+    Counting the matches of a solution (see to_bits) in a bitset is a popcount
+    of their intersection. get_slot_bits gives the bitsets to count them by slot.
+    """
+
+    def __init__(self, instance):
+        self.teams = instance.get_teams().keys_tl()
+        self.slots = TupList(instance.slots)
+        self.team_pos = SuperDict({team: pos for pos, team in enumerate(self.teams)})
+        self.slot_pos = SuperDict({slot: pos for pos, slot in enumerate(self.slots)})
+        self._windows = dict()
+        self._slot_bits = None
+        self.constraints = SuperDict(
+            {
+                tag: instance.get_constraint(tag).vapply(self._compile, tag=tag)
+                for tag in C_CAT.keys()
+            }
+        )
+
+    def get(self, tag, id) -> SuperDict:
+        return self.constraints[tag][id]
+
+    def get_windows(self, intp: int) -> SuperDict:
+        """
+        for each start slot, the sequence of intp consecutive slots starting in it.
+        """
+        if intp in self._windows:
+            return self._windows[intp]
+        all_slots = self.slots
+        self._windows[intp] = TupList(
+            (start, slot)
+            for pos, start in enumerate(all_slots[: -intp + 1])
+            for slot in all_slots[pos : pos + intp]
+        ).to_dict(result_col=1)
+        return self._windows[intp]
+
+    def get_bit(self, home, away, slot) -> int:
+        """
+        position of the match in a bitset: the matches of each slot are consecutive.
+        """
+        num_teams = len(self.teams)
+        return (
+            self.slot_pos[slot] * num_teams + self.team_pos[home]
+        ) * num_teams + self.team_pos[away]
+
+    def to_bits(self, matches) -> int:
+        """
+        bitset of the (home, away, slot) matches. Unknown teams or slots are ignored.
+        """
+        size = len(self.slots) * len(self.teams) ** 2
+        bits = bytearray((size + 7) // 8)
+        for match in matches:
+            try:
+                pos = self.get_bit(*match)
+            except KeyError:
+                continue
+            bits[pos >> 3] |= 1 << (pos & 7)
+        return int.from_bytes(bits, "little")
+
+    def get_slot_bits(self) -> SuperDict:
+        """
+        for each slot, the bitset of all matches in it.
+        """
+        if self._slot_bits is not None:
+            return self._slot_bits
+        slot_size = len(self.teams) ** 2
+        window = (1 << slot_size) - 1
+        self._slot_bits = self.slot_pos.vapply(lambda pos: window << (pos * slot_size))
+        return self._slot_bits
+
+    def _positions(self, values, positions: dict):
+        pos = np.array(sorted(set(positions[v] for v in values)), dtype=np.intp)
+        mask = np.zeros(len(positions), dtype=bool)
+        mask[pos] = True
+        return pos, mask
+
+    def _compile(self, constraint: dict, tag: str) -> SuperDict:
+        compiled = SuperDict()
+        for field in TEAM_FIELDS:
+            if field not in constraint:
+                continue
+            values = constraint[field]
+            pos, mask = self._positions(values, self.team_pos)
+            compiled[field + "_pos"], compiled[field + "_mask"] = pos, mask
+            compiled[field + "_set"] = frozenset(values)
+        if "slots" in constraint:
+            values = constraint["slots"]
+            pos, mask = self._positions(values, self.slot_pos)
+            compiled["slots_pos"], compiled["slots_mask"] = pos, mask
+            compiled["slots_set"] = frozenset(values)
+        if tag == "CA2":
+            # Experiment.check_CA2 expands the matches with mode2
+            compiled["matches_bits"] = (
+                get_matches_slots_constraint(constraint)
+                .to_dict(result_col=[0, 1, 2], indices=[0])
+                .vapply(lambda v: self.to_bits(apply_mode(v, mode=constraint["mode2"])))
+            )
+        elif tag == "CA3":
+            compiled["windows"] = self.get_windows(constraint["intp"])
+            compiled["starts_pos"] = np.array(
+                [self.slot_pos[start] for start in compiled["windows"]], dtype=np.intp
+            )
+        elif tag == "CA4":
+            # Experiment.check_CA4 expands the matches with mode2
+            compiled["matches_bits"] = self.to_bits(
+                apply_mode(
+                    get_matches_slots_constraint(constraint), mode=constraint["mode2"]
+                )
+            )
+        elif tag == "GA1":
+            meetings = frozenset(tuple(meeting) for meeting in constraint["meetings"])
+            compiled["meetings_set"] = meetings
+            compiled["meetings_pos"] = np.array(
+                [(self.team_pos[home], self.team_pos[away]) for home, away in meetings],
+                dtype=np.intp,
+            ).reshape(-1, 2)
+            compiled["matches_bits"] = self.to_bits(
+                (*meeting, slot) for meeting in meetings for slot in constraint["slots"]
+            )
+        elif tag in ["SE1", "FA2"]:
+            compiled["pairs"] = (
+                TupList(combinations(constraint["teams"], 2)).vapply(get_sym).unique2()
+            )
+            compiled["pairs_pos"] = np.array(
+                [
+                    (self.team_pos[t1], self.team_pos[t2])
+                    for t1, t2 in compiled["pairs"]
+                ],
+                dtype=np.intp,
+            ).reshape(-1, 2)
+        return compiled
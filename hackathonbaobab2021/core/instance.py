@@ -4,7 +4,8 @@ from cornflow_client import InstanceCore
 from cornflow_client.core.tools import load_json
 from pytups import SuperDict
 import xml.etree.ElementTree as ET
-from .tools import copy_dict
+import io
+from .cache import InstanceCache
 from .constants import C_CLUSTER, C_CAT, C_TUPLES, _CAT, _ID, INT_PROPS
 
 
@@ -12,6 +13,10 @@ class Instance(InstanceCore):
     def __init__(self, data: SuperDict):
         super().__init__(data)
         self.slots = OrderSet(data["slots"].keys_tl().sorted())
+        self._index = None
+
+    # default directory for the cache of from_xml
+    cache_dir = None
 
     schema = load_json(
         os.path.join(os.path.dirname(__file__), "../schemas/instance.json")
@@ -30,6 +35,16 @@ class Instance(InstanceCore):
             return self.data[tag]
         return self.data[tag].vfilter(lambda v: v["type"] == c_type)
 
+    def get_index(self):
+        """
+        the ConstraintIndex of the instance. It is built the first time it's needed.
+        """
+        if self._index is None:
+            from .index import ConstraintIndex
+
+            self._index = ConstraintIndex(self)
+        return self._index
+
     def get_penalty(self, tag, id) -> float:
         return self.data.get_m(tag, id, "penalty")
 
@@ -43,109 +58,119 @@ class Instance(InstanceCore):
 
     def to_dict(self) -> dict:
         # we will keep as close format to the original XML
-        masters = ["teams", "slots", "leagues"] + C_CAT.keys_tl()
-        data = {table: self.data[table].values_tl() for table in masters}
-
+        # all values are strings or numbers, so copying each row is enough
+        data = {
+            table: [dict(el) for el in self.data[table].values()]
+            for table in ["teams", "slots", "leagues"]
+        }
         # for each constraint, we go back to the flat XML notation
-        data = copy_dict(data)
         for c in C_CAT.keys():
-            for constraint in data[c]:
-                flatten_constraint(constraint)
+            data[c] = [flatten_constraint(dict(el)) for el in self.data[c].values()]
         return data
 
     @classmethod
-    def from_dict(cls, data: dict) -> "Instance":
+    def from_dict(cls, data: dict, copy: bool = True) -> "Instance":
+        """
+        :param copy: if False, the rows in data are parsed in place and used
+            by the instance, so data should not be used afterwards.
+        """
+        row = SuperDict if copy else lambda v: v
         data_p = SuperDict()
         for table in ["teams", "slots", "leagues"]:
-            data_p[table] = {el["id"]: el for el in data[table]}
+            data_p[table] = SuperDict({el["id"]: row(el) for el in data[table]})
         for table in C_CAT.keys():
-            data_p[table] = {el[_ID]: el for el in data[table]}
-
-        data_p = copy_dict(data_p)
-        for c in C_CAT.keys():
-            for constraint in data_p[c].values():
-                unflatten_constraint(constraint)
-
-        return cls(SuperDict.from_dict(data_p))
+            # ids are strings, as in the json format
+            data_p[table] = SuperDict(
+                {str(el[_ID]): unflatten_constraint(row(el)) for el in data[table]}
+            )
+        return cls(data_p)
 
     @classmethod
-    def from_xml(cls, path) -> "Instance":
+    def from_xml(cls, path, cache_dir: str = None) -> "Instance":
+        """
+        :param path: path or file object of the xml file.
+        :param cache_dir: directory of an InstanceCache (by default, Instance.cache_dir).
+            If given, the parsed data is stored there and reused while
+            the content of the file does not change.
+        """
+        if cache_dir is None:
+            cache_dir = cls.cache_dir
+        if cache_dir is None:
+            return cls(cls.read_xml(path))
+        if isinstance(path, str):
+            with open(path, "rb") as f:
+                content = f.read()
+        else:
+            content = path.read()
+        cache = InstanceCache(cache_dir)
+        key = cache.get_key(content)
+        data = cache.get(key)
+        if data is None:
+            data = cls.read_xml(io.BytesIO(content))
+            cache.set(key, data)
+        return cls(data)
+
+    @staticmethod
+    def read_xml(path) -> SuperDict:
 
         # by default, all properties that start with _ are created by us.
 
         # follows a special case of the RobinX XML format.
-        tree = ET.parse(path)
-        root = tree.getroot()
-        resources = root.find("Resources")
-        as_dict_list = lambda l: TupList(l).vapply(lambda v: v.attrib)
-
-        data_p = SuperDict(teams="Teams", slots="Slots", leagues="Leagues").vapply(
-            lambda v: as_dict_list(resources.find(v))
-        )
-        # we want to index the list of dictionaries by their own id
-        for k, v in data_p.items():
-            data_p[k] = SuperDict({vv["id"]: vv for vv in v})
-
-        constraints = root.find("Constraints")
-
-        # we want to store the category of the constraint.
-        # we create the _cat field
-
-        def read_constraint(c):
-            _dict = dict(c.attrib)
-            _dict[_CAT] = c.tag
-            return _dict
-
-        # we read all constraints data
-        read_constraints = lambda l: TupList(l).vapply(read_constraint)
-
-        # we create the _id field to represent the enumeration of constraints in each category
-        def _treat(constraint_arr):
-            _dict = {pos: {**{_ID: pos}, **el} for pos, el in enumerate(constraint_arr)}
-            for v in _dict.values():
-                unflatten_constraint(v)
-
-            return SuperDict(_dict)
-
-        constraints_per_cluster = C_CLUSTER.vapply(
-            lambda c: constraints.find(c)
-        ).vapply(read_constraints)
-        # we will group by constraint type, not the 5 large groups.
-        constraints_per_type = C_CAT.vapply(lambda v: [])
-        for constraint_cluster in constraints_per_cluster.values():
-            for constraint in constraint_cluster:
-                constraints_per_type[constraint[_CAT]].append(constraint)
-
-        data_p.update(constraints_per_type.vapply(_treat))
-
-        return cls(data_p)
+        # the file is read as a stream of elements, that are cleared once read.
+        resources = SuperDict(Teams="teams", Slots="slots", Leagues="leagues")
+        clusters = C_CLUSTER.values_tl().to_set()
+        data_p = resources.values_tl().to_dict(None).vapply(lambda v: SuperDict())
+        data_p.update(C_CAT.vapply(lambda v: SuperDict()))
+
+        parents = []
+        for event, elem in ET.iterparse(path, events=("start", "end")):
+            if event == "start":
+                parents.append(elem.tag)
+                continue
+            parents.pop()
+            if len(parents) < 2:
+                elem.clear()
+                continue
+            parent, grandparent = parents[-1], parents[-2]
+            if grandparent == "Resources" and parent in resources:
+                # we want to index the resources by their own id
+                data_p[resources[parent]][elem.attrib["id"]] = dict(elem.attrib)
+            elif grandparent == "Constraints" and parent in clusters:
+                # we will group by constraint type, not the 5 large groups.
+                # we create the _id field to represent the enumeration of
+                # constraints in each category and the _cat field to store it
+                table = data_p[elem.tag]
+                constraint = {**{_ID: len(table)}, **elem.attrib, **{_CAT: elem.tag}}
+                table[len(table)] = unflatten_constraint(constraint)
+            elem.clear()
+
+        return data_p
 
 
 def flatten_constraint(constraint):
-    for key in C_CAT[constraint[_CAT]]:
-        _list = TupList(constraint[key])
-        # we flatten the tuples
-        if C_TUPLES.get_m(constraint[_CAT], key):
-            _list = _list.vapply(lambda v: ",".join(v))
-        # we flatten the lists
-        _list = ";".join(_list)
-        constraint[key] = _list
+    cat = constraint[_CAT]
+    for key in C_CAT[cat]:
+        # we flatten the tuples and then the lists
+        if C_TUPLES.get_m(cat, key):
+            constraint[key] = ";".join(",".join(v) for v in constraint[key])
+        else:
+            constraint[key] = ";".join(constraint[key])
     for el in INT_PROPS:
-        try:
+        if el in constraint:
             constraint[el] = str(constraint[el])
-        except:
-            continue
+    return constraint
 
 
 def unflatten_constraint(constraint):
-    for key in C_CAT[constraint[_CAT]]:
-        _list = TupList(constraint[key].split(";"))
-        _list = _list.vfilter(lambda v: v)
-        if len(_list) and C_TUPLES.get_m(constraint[_CAT], key):
-            _list = _list.vapply(lambda v: tuple(v.split(",")))
-        constraint[key] = _list
+    cat = constraint[_CAT]
+    for key in C_CAT[cat]:
+        values = [v for v in constraint[key].split(";") if v]
+        if C_TUPLES.get_m(cat, key):
+            values = [tuple(v.split(",")) for v in values]
+        constraint[key] = TupList(values)
     for el in INT_PROPS:
         try:
             constraint[el] = int(constraint[el])
         except:
             continue
+    return constraint
@@ -1,48 +1,152 @@
 import os
+from array import array
+import numpy as np
 from cornflow_client import SolutionCore
 from cornflow_client.core.tools import load_json
 from pytups import SuperDict, TupList
 
+# the columns of the assignment
+FIELDS = ("home", "away", "slot")
+
 
 class Solution(SolutionCore):
+    """
+    The assignment is kept in three parallel int arrays (home, away and slot)
+    where each team or slot is the position of its id in ids.
+    The rows as dictionaries (data, get_assignment) and the rest of the views
+    are built the first time they are asked for.
+    data can be changed in place: after it is read, the columns are encoded
+    again from it the next time they are needed.
+    """
+
     schema = load_json(
         os.path.join(os.path.dirname(__file__), "../schemas/solution.json")
     )
 
     def __init__(self, data: dict) -> None:
         super().__init__(data)
-        self.data["assignment"] = TupList(data["assignment"])
+
+    @classmethod
+    def from_rows(cls, rows) -> "Solution":
+        """
+        solution with an assignment row for each (home, away, slot) in rows.
+        """
+        solution = cls(dict(assignment=[]))
+        for row in rows:
+            solution._append(row)
+        return solution
 
     @property
     def data(self) -> SuperDict:
+        if self._data is None:
+            self._data = SuperDict(self._other, assignment=self.get_assignment())
+        # it can be changed by whoever reads it
+        self._stale = True
         return self._data
 
     @data.setter
-    def data(self, value: SuperDict):
-        self._data = value
+    def data(self, value: dict):
+        self._encode(value)
+        self._data = None
+
+    def _encode(self, value: dict) -> None:
+        self.ids = []
+        self._codes = dict()
+        self._columns = tuple(array("i") for _ in FIELDS)
+        # other keys in the rows, by row position
+        self._extra = dict()
+        self._other = {k: v for k, v in value.items() if k != "assignment"}
+        self._views = dict()
+        self._stale = False
+        for pos, row in enumerate(value["assignment"]):
+            self._append([row[field] for field in FIELDS])
+            if len(row) > len(FIELDS):
+                self._extra[pos] = {k: v for k, v in row.items() if k not in FIELDS}
+
+    def _sync(self) -> None:
+        """
+        encodes the columns again if data was read since they were encoded.
+        """
+        if self._stale:
+            self._encode(self._data)
+
+    def _append(self, row) -> None:
+        for column, _id in zip(self._columns, row):
+            code = self._codes.get(_id)
+            if code is None:
+                code = self._codes[_id] = len(self.ids)
+                self.ids.append(_id)
+            column.append(code)
+
+    def __len__(self) -> int:
+        self._sync()
+        return len(self._columns[0])
+
+    def _get_view(self, name, func):
+        self._sync()
+        if name not in self._views:
+            self._views[name] = func()
+        return self._views[name]
 
     def get_assignment(self) -> TupList:
-        return self.data["assignment"]
+        def func():
+            rows = TupList(dict(zip(FIELDS, row)) for row in self.get_home_away_slot())
+            for pos, extra in self._extra.items():
+                rows[pos].update(extra)
+            return rows
+
+        return self._get_view("assignment", func)
 
     def get_home_away_slot(self) -> TupList:
-        return self.get_assignment().take(["home", "away", "slot"])
+        def func():
+            ids = self.ids
+            return TupList(
+                (ids[home], ids[away], ids[slot])
+                for home, away, slot in zip(*self._columns)
+            )
+
+        return self._get_view("home_away_slot", func)
 
     def get_match_slot(self) -> SuperDict:
         """
         for each match, the slot when it happened
         """
-        assignment = self.get_assignment()
-        return assignment.to_dict(
-            result_col=["slot"], indices=["home", "away"], is_list=False
-        )
+
+        def func():
+            ids = self.ids
+            home, away, slot = self._columns
+            result = SuperDict()
+            for row in zip(home, away, slot):
+                result[ids[row[0]], ids[row[1]]] = ids[row[2]]
+            return result
+
+        return self._get_view("match_slot", func)
 
     def get_pair_slots(self) -> SuperDict:
         """
         for each pair (a, b) | (a < b), the ordered slots they play.
         """
-        match_slot = self.get_match_slot().vapply(TupList)
+        match_slot = self.get_match_slot().vapply(lambda v: TupList([v]))
         return (
             match_slot.kfilter(lambda k: k[0] < k[1])
             .kvapply(lambda k, v: v + match_slot[k[1], k[0]])
             .vapply(sorted)
         )
+
+    def get_positions(self, team_pos: dict, slot_pos: dict) -> np.ndarray:
+        """
+        int array with the (home, away, slot) positions of each row of the assignment
+        (e.g., the positions in the ConstraintIndex).
+        Raises KeyError if a team or a slot has no position.
+        """
+        self._sync()
+        result = np.empty((len(self), len(FIELDS)), dtype=np.intp)
+        for col, (column, positions) in enumerate(
+            zip(self._columns, [team_pos, team_pos, slot_pos])
+        ):
+            codes = np.array(column, dtype=np.intp)
+            lookup = np.zeros(len(self.ids), dtype=np.intp)
+            for code in np.unique(codes):
+                lookup[code] = positions[self.ids[code]]
+            result[:, col] = lookup[codes]
+        return result
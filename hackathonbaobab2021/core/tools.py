@@ -125,3 +125,15 @@ def indent(elem, level=0):
     else:
         if level and (not elem.tail or not elem.tail.strip()):
             elem.tail = i
+
+
+def popcount(bits: int) -> int:
+    """
+    number of bits set in bits.
+    """
+    return bin(bits).count("1")
+
+
+if hasattr(int, "bit_count"):
+    # python >= 3.10
+    popcount = int.bit_count
@@ -0,0 +1,186 @@
+from hackathonbaobab2021 import SportsScheduling
+from hackathonbaobab2021.core import Instance, Experiment
+from hackathonbaobab2021.core import DenseExperiment, DenseSolution
+from hackathonbaobab2021.core import tools
+from hackathonbaobab2021.core.constants import C_CAT, C_TUPLES, _ID, GLOBAL, EVERY
+from pytups import SuperDict, TupList
+from timeit import default_timer as timer
+from functools import partial
+from typing import List
+import platform
+import os
+
+app = SportsScheduling()
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "../data")
+INSTANCES = ["ITC2021_Test1", "ITC2021_Test2", "ITC2021_Test3"]
+TEAM_FIELDS = ["teams", "teams1", "teams2"]
+
+
+def time_function(func, repeat: int = 3) -> dict:
+    """
+    runs func repeat times and returns the min and mean wall time in seconds.
+    """
+    times = []
+    for _ in range(repeat):
+        start = timer()
+        func()
+        times.append(timer() - start)
+    return dict(min=min(times), mean=sum(times) / len(times), repeat=repeat)
+
+
+def scale_instance(instance: Instance, factor: int) -> Instance:
+    """
+    returns a synthetic instance with factor times the teams and the constraints.
+    Each copy of the constraints uses its own teams and its slots are shifted.
+    The number of slots is the one of a double round robin (2 * teams - 2).
+    """
+    data = instance.data
+    num_teams, num_slots = len(data["teams"]), len(data["slots"])
+    new_teams = num_teams * factor
+    new_slots = 2 * new_teams - 2
+    team = lambda t, copy: str(int(t) + copy * num_teams)
+    slot = lambda s, copy: str((int(s) + copy * num_slots) % new_slots)
+
+    result = SuperDict(leagues=data["leagues"].copy_deep())
+    result["teams"] = SuperDict(
+        {
+            team(t, copy): dict(v, id=team(t, copy), name="Team " + team(t, copy))
+            for copy in range(factor)
+            for t, v in data["teams"].items()
+        }
+    )
+    result["slots"] = SuperDict(
+        {str(s): dict(id=str(s), name="Slot {}".format(s)) for s in range(new_slots)}
+    )
+    for tag in C_CAT.keys():
+        constraints = [
+            _scale_constraint(c, partial(team, copy=copy), partial(slot, copy=copy))
+            for copy in range(factor)
+            for c in data[tag].values()
+        ]
+        result[tag] = SuperDict(
+            {pos: {**c, **{_ID: pos}} for pos, c in enumerate(constraints)}
+        )
+    return Instance(result)
+
+
+def _scale_constraint(constraint: dict, team, slot) -> dict:
+    result = dict(constraint)
+    for field in C_CAT[constraint["_cat"]]:
+        if C_TUPLES.get_m(constraint["_cat"], field):
+            values = TupList(constraint[field]).vapply(lambda v: tuple(map(team, v)))
+        elif field in TEAM_FIELDS:
+            values = TupList(constraint[field]).vapply(team)
+        else:
+            values = TupList(constraint[field]).vapply(slot)
+        result[field] = values
+    return result
+
+
+def get_checks(experiment: Experiment) -> SuperDict:
+    """
+    all the checks of an experiment, with the arguments used by check_solution.
+    """
+    return SuperDict(
+        check_CA1=experiment.check_CA1,
+        check_CA2=experiment.check_CA2,
+        check_CA3=experiment.check_CA3,
+        check_CA4_slots=partial(experiment.check_CA4, level=EVERY),
+        check_CA4_global=partial(experiment.check_CA4, level=GLOBAL),
+        check_GA1=experiment.check_GA1,
+        check_SE1=experiment.check_SE1,
+        check_BR1=experiment.check_BR1,
+        check_BR2=experiment.check_BR2,
+        check_FA2=experiment.check_FA2,
+        check_num_home=partial(experiment.check_num_matches, "home"),
+        check_num_away=partial(experiment.check_num_matches, "away"),
+        check_one_match_per_slot=experiment.check_one_match_per_slot,
+        check_solution=experiment.check_solution,
+        get_objective=experiment.get_objective,
+    )
+
+
+def benchmark_instance(
+    instance: Instance,
+    path: str = None,
+    repeat: int = 3,
+    experiments: List[type] = (Experiment, DenseExperiment),
+) -> dict:
+    """
+    times the loading of the instance, the default solver and all the checks.
+
+    :param path: xml file of the instance, if any, to time Instance.from_xml
+    :param experiments: classes whose checks are timed on the solution
+    """
+    result = SuperDict()
+    if path is not None:
+        result["from_xml"] = time_function(lambda: Instance.from_xml(path), repeat)
+    data = instance.to_dict()
+    result["to_dict"] = time_function(instance.to_dict, repeat)
+    result["from_dict"] = time_function(lambda: Instance.from_dict(data), repeat)
+    solver = app.get_solver("default")(instance)
+    result["Default.solve"] = time_function(lambda: solver.solve({}), 1)
+    for experiment_class in experiments:
+        experiment = experiment_class(instance, solver.solution)
+        name = experiment_class.__name__
+        if isinstance(experiment, DenseExperiment):
+            # the checks reuse the DenseSolution after the first call
+            result[name + ".get_dense"] = time_function(
+                lambda: DenseSolution(instance, solver.solution), repeat
+            )
+        for check, func in get_checks(experiment).items():
+            result[name + "." + check] = time_function(func, repeat)
+    return result
+
+
+def get_size(instance: Instance) -> dict:
+    return dict(
+        teams=len(instance.data["teams"]),
+        slots=len(instance.data["slots"]),
+        constraints=sum(len(instance.data[tag]) for tag in C_CAT.keys()),
+    )
+
+
+def run_benchmark(
+    instances: List[str] = None,
+    factors: List[int] = (2, 4),
+    repeat: int = 3,
+    output: str = None,
+) -> dict:
+    """
+    benchmarks the bundled instances and their versions scaled by each factor.
+
+    :param instances: names of the xml files inside the data directory
+    :param output: if given, the json file where the results are written
+    :return: dictionary with the machine, and for each instance, its size and times
+    """
+    if instances is None:
+        instances = INSTANCES
+    cases = SuperDict()
+    for name in instances:
+        path = os.path.join(DATA_DIR, name + ".xml")
+        instance = Instance.from_xml(path)
+        cases[name] = dict(
+            size=get_size(instance),
+            times=benchmark_instance(instance, path, repeat=repeat),
+        )
+        for factor in factors:
+            scaled = scale_instance(instance, factor)
+            cases["{}_x{}".format(name, factor)] = dict(
+                size=get_size(scaled),
+                times=benchmark_instance(scaled, repeat=repeat),
+            )
+    result = dict(
+        python=platform.python_version(),
+        machine=platform.machine(),
+        repeat=repeat,
+        instances=cases,
+    )
+    if output is not None:
+        tools.write_json(result, output)
+    return result
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,72 @@
+from hackathonbaobab2021.core import Instance
+from hackathonbaobab2021.core.batch import get_chunksize
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import List
+import zipfile
+import os
+
+
+def get_xml_files(source: str) -> List[str]:
+    """
+    names of the xml files inside the directory or zip file source.
+    """
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as zip_obj:
+            names = zip_obj.namelist()
+    else:
+        names = os.listdir(source)
+    return sorted(name for name in names if name.lower().endswith(".xml"))
+
+
+def convert_instance(
+    source: str, name: str, path_out: str, cache_dir: str = None
+) -> str:
+    """
+    converts the xml file name inside source (a directory or a zip file)
+    into a json file inside path_out.
+
+    :return: the path to the json file
+    """
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as zip_obj:
+            with zip_obj.open(name) as f:
+                instance = Instance.from_xml(f, cache_dir=cache_dir)
+    else:
+        instance = Instance.from_xml(os.path.join(source, name), cache_dir=cache_dir)
+    filename = os.path.splitext(os.path.basename(name))[0] + ".json"
+    json_path = os.path.join(path_out, filename)
+    instance.to_json(json_path)
+    return json_path
+
+
+def convert_instances(
+    source: str, path_out: str, workers: int = None, cache_dir: str = None
+) -> List[str]:
+    """
+    converts all the xml instances in a directory or a zip file into json files.
+
+    :param source: directory or zip file with the RobinX xml files
+    :param path_out: directory where the json files are written
+    :param workers: if given, number of processes used to convert the files
+    :param cache_dir: if given, directory of the cache of parsed instances
+    :return: the paths to the json files
+    """
+    if not os.path.exists(path_out):
+        os.makedirs(path_out)
+    names = get_xml_files(source)
+    func = partial(_convert_instance, source, path_out, cache_dir)
+    if not workers:
+        return [func(name) for name in names]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(
+            executor.map(func, names, chunksize=get_chunksize(len(names), workers))
+        )
+
+
+def _convert_instance(source, path_out, cache_dir, name):
+    return convert_instance(source, name, path_out, cache_dir=cache_dir)
+
+
+if __name__ == "__main__":
+    pass
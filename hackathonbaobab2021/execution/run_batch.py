@@ -2,8 +2,12 @@ from hackathonbaobab2021 import SportsScheduling
 from hackathonbaobab2021.core import ZipBatch
 from hackathonbaobab2021.core import tools
 import zipfile
+import json
+import pandas as pd
 import os
 import shutil
+import multiprocessing as mp
+from multiprocessing.connection import wait
 from timeit import default_timer as timer
 import logging as log
 from typing import List
@@ -11,6 +15,10 @@ from typing import List
 app = SportsScheduling()
 
 
+# extra seconds a process gets on top of the timeLimit before being terminated
+TIME_LIMIT_MARGIN = 10
+
+
 def solve_zip(
     zip_name: str,
     path_out: str,
@@ -19,6 +27,7 @@ def solve_zip(
     test: bool = False,
     instances: List[str] = None,
     options: dict = None,
+    workers: int = 1,
 ) -> None:
     if not os.path.exists(path_out):
         os.mkdir(path_out)
@@ -42,37 +51,111 @@ def solve_zip(
         all_files = all_files[:3]
     if instances is not None:
         all_files = instances
-    solver = app.get_solver(solver_name)
     # for each file:
+    tasks = []
     for filename in all_files:
-        # filename = all_files[0]
         experiment_dir = os.path.join(batch_out_path, filename)
         if os.path.exists(experiment_dir):
             shutil.rmtree(experiment_dir)
         os.mkdir(experiment_dir)
-        data = zip_obj.read(filename)
-        inst = app.instance.from_mm(path="", content=data.decode().splitlines(True))
-        algo = solver(inst)
-        start = timer()
-        try:
-            status = algo.solve(options)
-        except Exception as e:
-            status = 0
-            with open(os.path.join(experiment_dir, "error.txt"), "w") as f:
-                f.write(str(e))
-
-        # export everything:
-        status_conv = {4: "Optimal", 2: "Feasible", 3: "Infeasible", 0: "Unknown"}
-        _log = dict(
-            time=timer() - start,
-            solver=solver_name,
-            status=status_conv.get(status, "Unknown"),
-        )
-        _log.update(options)
-        tools.write_json(_log, os.path.join(experiment_dir, "options.json"))
-        inst.to_json(os.path.join(experiment_dir, "input.json"))
-        if algo.solution is not None:
-            algo.solution.to_json(os.path.join(experiment_dir, "output.json"))
+        tasks.append((path, filename, experiment_dir, solver_name, options))
+    if workers > 1:
+        solve_parallel(tasks, workers, time_limit=options.get("timeLimit"))
+        return
+    for task in tasks:
+        solve_instance(*task)
+
+
+def solve_instance(
+    zip_path: str, filename: str, experiment_dir: str, solver_name: str, options: dict
+) -> None:
+    """
+    solves the instance filename inside the zip and exports everything
+    to experiment_dir.
+    """
+    with zipfile.ZipFile(zip_path) as zip_obj:
+        with zip_obj.open(filename) as f:
+            inst = app.instance.from_xml(f)
+    solver = app.get_solver(solver_name)
+    algo = solver(inst)
+    start = timer()
+    solver_log = None
+    try:
+        # solvers that write a log (see Batch.get_logs) write it in the experiment
+        log_path = os.path.join(experiment_dir, "results.log")
+        status = algo.solve(dict(options, logPath=log_path))
+    except Exception as e:
+        status = 0
+        write_error(experiment_dir, str(e))
+    if isinstance(status, dict):
+        solver_log = status.get("log")
+        status = status.get("status")
+
+    # export everything:
+    write_log(experiment_dir, timer() - start, solver_name, options, status, solver_log)
+    inst.to_json(os.path.join(experiment_dir, "input.json"))
+    if algo.solution is not None:
+        algo.solution.to_json(os.path.join(experiment_dir, "output.json"))
+
+
+def solve_parallel(tasks: List[tuple], workers: int, time_limit: float = None):
+    """
+    solves each task (arguments to solve_instance) in its own process,
+    with at most workers processes at the same time.
+    A process that goes over the time_limit (plus a margin) is terminated.
+    """
+    pending = list(tasks)
+    running = {}
+    while pending or running:
+        while pending and len(running) < workers:
+            task = pending.pop(0)
+            process = mp.Process(target=solve_instance, args=task)
+            process.start()
+            running[process] = (task, timer())
+        wait([p.sentinel for p in running], timeout=1)
+        for process, (task, start) in list(running.items()):
+            zip_path, filename, experiment_dir, solver_name, options = task
+            elapsed = timer() - start
+            if not process.is_alive():
+                process.join()
+                running.pop(process)
+                if process.exitcode != 0:
+                    message = "process ended with exit code {}"
+                    write_error(experiment_dir, message.format(process.exitcode))
+                    write_log(experiment_dir, elapsed, solver_name, options, 0)
+            elif time_limit is not None and elapsed > time_limit + TIME_LIMIT_MARGIN:
+                process.terminate()
+                process.join()
+                running.pop(process)
+                message = "process terminated after {:.1f} seconds"
+                write_error(experiment_dir, message.format(elapsed))
+                write_log(experiment_dir, elapsed, solver_name, options, 0)
+
+
+def write_error(experiment_dir: str, message: str) -> None:
+    with open(os.path.join(experiment_dir, "error.txt"), "w") as f:
+        f.write(message)
+
+
+def write_log(
+    experiment_dir: str,
+    time: float,
+    solver_name: str,
+    options: dict,
+    status,
+    solver_log: dict = None,
+) -> None:
+    status_conv = {4: "Optimal", 2: "Feasible", 3: "Infeasible", 0: "Unknown"}
+    _log = dict(
+        time=time,
+        solver=solver_name,
+        status=status_conv.get(status, "Unknown"),
+    )
+    _log.update(options)
+    if solver_log is not None:
+        # information the solver returns about its execution
+        _log["log"] = solver_log
+    tools.write_json(_log, os.path.join(experiment_dir, "options.json"))
 
 
 def solve_scenarios_and_zip(
@@ -94,20 +177,113 @@ def solve_scenarios_and_zip(
     shutil.make_archive(path_to_dir, "zip", root_dir=root_dir, base_dir=base_dir)
 
 
-def get_table(zipfile_name: str):
-    batch = ZipBatch(zipfile_name)
-    objs = batch.get_objective_function()
-    opts = batch.get_options()
-    errors = batch.get_errors().vapply(lambda v: dict(errors=v))
-    opts.update(errors)
-    opts_df = batch.format_df(opts).drop(["instance"], axis=1)
-    table = (
-        batch.format_df(objs)
-        .rename(columns={0: "objective"})
-        .drop(["instance"], axis=1)
+def get_table(zipfile_name: str, workers: int = None, metrics_cache: str = None):
+    batch = ZipBatch(zipfile_name, workers=workers, metrics_cache=metrics_cache)
+    return get_batch_table(batch)
+
+
+def get_batch_table(batch: ZipBatch) -> pd.DataFrame:
+    # experiments are read one at a time, only the metrics are kept
+    table = pd.DataFrame(
+        [
+            dict(scenario=scenario, name=name, **metrics)
+            for (scenario, name), metrics in batch.iter_metrics()
+        ],
+        columns=["scenario", "name", "objective", "errors"],
+    )
+    # the log of the solver is a nested dictionary, it's only kept in options.json
+    options = batch.get_options().vapply(
+        lambda v: {k: value for k, value in v.items() if k != "log"}
     )
+    opts_df = batch.format_df(options).drop(["instance"], axis=1)
     result = table.merge(opts_df, on=["scenario", "name"], how="left")
-    return result
+    # as in the original table, errors is the last column
+    return result[[c for c in result.columns if c != "errors"] + ["errors"]]
+
+
+def export_batch(
+    zipfile_name: str,
+    path_out: str,
+    file_format: str = "parquet",
+    workers: int = None,
+    metrics_cache: str = None,
+) -> None:
+    """
+    writes the table of the batch (see get_table) and, if there are solver logs,
+    the log and status tables (see Batch.get_log_df and Batch.get_status_df).
+
+    With csv, path_out is the csv file of the table.
+    With parquet or feather, path_out is a directory with one dataset per table
+    (table, log and status), partitioned by scenario. Exporting into an existing
+    directory only replaces the scenarios of the zip, the rest are kept.
+    """
+    batch = ZipBatch(zipfile_name, workers=workers, metrics_cache=metrics_cache)
+    table = get_batch_table(batch)
+    if file_format == "csv":
+        table.to_csv(path_out, index=False)
+        return
+    tables = dict(table=table)
+    if len(batch.get_logs()):
+        tables["log"] = batch.get_log_df()
+        tables["status"] = batch.get_status_df()
+    for name, _table in tables.items():
+        write_dataset(_table, os.path.join(path_out, name), file_format)
+
+
+def write_dataset(table: pd.DataFrame, path: str, file_format: str = "parquet"):
+    """
+    writes the table as a dataset with one directory per scenario
+    (scenario=<name>). The directories of the scenarios in the table
+    are replaced, the rest are not touched.
+    Columns with dictionaries or lists are stored as json, data frames are dropped.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    table = table.drop(columns=[c for c in table.columns if _has_frames(table[c])])
+    for column in table.columns[table.dtypes == object]:
+        table[column] = table[column].map(_to_scalar)
+    ds.write_dataset(
+        pa.Table.from_pandas(table, preserve_index=False),
+        path,
+        format=file_format,
+        partitioning=_get_partitioning(),
+        existing_data_behavior="delete_matching",
+    )
+
+
+def read_dataset(path: str, file_format: str = "parquet") -> pd.DataFrame:
+    """
+    reads a dataset written by write_dataset. Columns that only exist in
+    some scenarios are empty in the rest.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    options = dict(format=file_format, partitioning=_get_partitioning())
+    dataset = ds.dataset(path, **options)
+    schemas = [dataset.schema] + [f.physical_schema for f in dataset.get_fragments()]
+    schema = pa.unify_schemas(schemas, promote_options="permissive")
+    table = ds.dataset(path, schema=schema, **options).to_table().to_pandas()
+    columns = ["scenario"] + [c for c in table.columns if c != "scenario"]
+    return table[columns]
+
+
+def _get_partitioning():
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    return ds.partitioning(pa.schema([("scenario", pa.string())]), flavor="hive")
+
+
+def _has_frames(column: pd.Series) -> bool:
+    return column.map(lambda v: isinstance(v, pd.DataFrame)).any()
+
+
+def _to_scalar(value):
+    if isinstance(value, (dict, list, tuple)):
+        return json.dumps(value, default=str)
+    return value
 
 
 if __name__ == "__main__":
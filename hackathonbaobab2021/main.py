@@ -62,8 +62,23 @@ def cli():
 @click.option(
     "--options", default="{}", cls=PythonJsonOption, help="Options to pass to solver."
 )
+@click.option(
+    "--workers",
+    default=1,
+    type=int,
+    help="number of instances solved at the same time, each in its own process.",
+)
 def solve_scenarios(
-    directory, scenarios, scenario, solver, test, instances, instance, zip, options
+    directory,
+    scenarios,
+    scenario,
+    solver,
+    test,
+    instances,
+    instance,
+    zip,
+    options,
+    workers,
 ):
     """Solves a batch of instances inside a zip with a solver and zips the results"""
     # print(scenarios)
@@ -82,19 +97,88 @@ def solve_scenarios(
         instances=instances,
         zip=zip,
         options=options,
+        workers=workers,
     )
 
 
 @cli.command()
 @click.option("--path", default="default", help="the path to the zipfile to analyse.")
-@click.option("--path_out", help="the path for the output csv.")
-def export_table(path, path_out):
+@click.option(
+    "--path_out",
+    help="the path for the output csv (or directory, for parquet and feather).",
+)
+@click.option(
+    "--workers",
+    default=None,
+    type=int,
+    help="number of processes used to evaluate the experiments.",
+)
+@click.option(
+    "--metrics_cache",
+    default=None,
+    help="sqlite file to reuse the metrics of the experiments that did not change.",
+)
+@click.option(
+    "--format",
+    "file_format",
+    default="csv",
+    type=click.Choice(["csv", "parquet", "feather"]),
+    help="parquet and feather also export the logs and add the scenarios to path_out.",
+)
+def export_table(path, path_out, workers, metrics_cache, file_format):
     """Reads a result zip and exports the table in a csv"""
-    table = rb.get_table(path)
-    table.to_csv(path_out, index=False)
+    rb.export_batch(
+        path,
+        path_out,
+        file_format=file_format,
+        workers=workers,
+        metrics_cache=metrics_cache,
+    )
     return
 
 
+@cli.command()
+@click.option(
+    "--source", required=True, help="directory or zip file with the xml instances."
+)
+@click.option("--path_out", required=True, help="directory to write the json files.")
+@click.option(
+    "--workers", default=None, type=int, help="number of processes to convert files."
+)
+@click.option(
+    "--cache_dir", default=None, help="directory to cache the parsed instances."
+)
+def convert_instances(source, path_out, workers, cache_dir):
+    """Converts all the xml instances in a directory or zip into json files"""
+    import execution.convert_instances as ci
+
+    ci.convert_instances(source, path_out, workers=workers, cache_dir=cache_dir)
+
+
+@cli.command()
+@click.option(
+    "--output", default="benchmark.json", help="json file to write the results."
+)
+@click.option(
+    "--instances",
+    default="None",
+    cls=PythonLiteralOption,
+    help="list of bundled instances to benchmark.",
+)
+@click.option(
+    "--factors",
+    default="[2, 4]",
+    cls=PythonLiteralOption,
+    help="list of factors to scale each instance.",
+)
+@click.option("--repeat", default=3, type=int, help="times each function is run.")
+def benchmark(output, instances, factors, repeat):
+    """Times loading, solving and checking the bundled and scaled instances"""
+    import execution.benchmark as bm
+
+    bm.run_benchmark(instances=instances, factors=factors, repeat=repeat, output=output)
+
+
 # Press the green button in the gutter to run the script.
 if __name__ == "__main__":
     cli()
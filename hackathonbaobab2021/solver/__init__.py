@@ -1 +1,7 @@
 from .default import Default
+from .round_robin import RoundRobin
+from .annealing import Annealing
+from .portfolio import Portfolio
+from .cpsat import CPSat
+from .polish import Polish
+from .lns import LNS
@@ -0,0 +1,166 @@
+from ..core import Experiment, Solution, IncrementalEvaluator
+from .round_robin import RoundRobin, MIRRORED, is_double_round_robin
+from cornflow_client.constants import (
+    STATUS_TIME_LIMIT,
+    SOLUTION_STATUS_FEASIBLE,
+)
+from timeit import default_timer as timer
+import random
+import math
+
+# cost of each HARD violation, added to the objective
+HARD_WEIGHT = 1000
+# the temperature goes from the initial one to this fraction of it
+FINAL_TEMPERATURE = 0.001
+# number of moves used to estimate the initial temperature
+SAMPLE_MOVES = 50
+# iterations between checks of must_stop and get_shared
+CHECK_EVERY = 100
+
+
+class Annealing(Experiment):
+    """
+    Simulated annealing over double round robins.
+    It starts from a RoundRobin solution (or the given solution, with warmStart)
+    and uses the neighbourhoods of the IncrementalEvaluator:
+    swap homes, swap slots, swap teams, partial swap slots and partial swap teams.
+    Moves are scored with the change in objective plus HARD_WEIGHT times
+    the change in HARD violations.
+
+    options:
+
+    * timeLimit: seconds of search.
+    * seed: seed for the random numbers and the initial solution.
+    * warmStart: if True, it starts from the solution of the experiment.
+        If it is not a double round robin (see is_double_round_robin),
+        it starts from a RoundRobin solution, as without warmStart.
+        The polish solver can repair it instead, keeping most of its matches.
+    * pattern: pattern of the initial RoundRobin solution.
+    """
+
+    def solve(self, options: dict) -> dict:
+        start = timer()
+        time_limit = options.get("timeLimit", 10)
+        seed = options.get("seed")
+        rnd = random.Random(seed)
+        if (
+            self.solution is None
+            or not options.get("warmStart")
+            or not is_double_round_robin(
+                self.instance, self.solution.get_home_away_slot()
+            )
+        ):
+            initial = RoundRobin(self.instance)
+            initial.solve(
+                dict(
+                    seed=rnd.randrange(1000000),
+                    pattern=options.get("pattern", MIRRORED),
+                )
+            )
+            self.solution = initial.solution
+        evaluator = IncrementalEvaluator(self)
+        neighbours = self.get_neighbours(evaluator, rnd)
+
+        current = cost(evaluator.objective, evaluator.infeasibility)
+        best = current
+        best_rows = list(evaluator.matches.elements())
+        self.on_best(best, best_rows)
+        temperature = self.initial_temperature(evaluator, neighbours, rnd)
+        iterations = accepted = 0
+        while True:
+            elapsed = timer() - start
+            if elapsed >= time_limit:
+                break
+            if iterations % CHECK_EVERY == 0:
+                if self.must_stop():
+                    break
+                shared = self.get_shared()
+                if shared is not None and shared[0] < current:
+                    # we continue from a better solution found somewhere else
+                    evaluator = IncrementalEvaluator(
+                        Experiment(self.instance, Solution.from_rows(shared[1]))
+                    )
+                    neighbours = self.get_neighbours(evaluator, rnd)
+                    current = cost(evaluator.objective, evaluator.infeasibility)
+            # geometric cooling on the elapsed time
+            temp = temperature * FINAL_TEMPERATURE ** (elapsed / time_limit)
+            move = rnd.choice(neighbours)()
+            iterations += 1
+            if move is None:
+                continue
+            delta = cost(*evaluator.delta(move))
+            if delta > 0 and rnd.random() >= math.exp(-delta / temp):
+                continue
+            evaluator.apply(move)
+            accepted += 1
+            current += delta
+            if current < best:
+                best = current
+                best_rows = list(evaluator.matches.elements())
+                self.on_best(best, best_rows)
+
+        self.solution = Solution.from_rows(best_rows)
+        self.stats = dict(
+            iterations=iterations, accepted=accepted, cost=best, time=timer() - start
+        )
+        return dict(
+            status=STATUS_TIME_LIMIT,
+            status_sol=SOLUTION_STATUS_FEASIBLE,
+            log=self.stats,
+        )
+
+    def on_best(self, best: float, rows: list) -> None:
+        """
+        called with the cost and the (home, away, slot) rows of each new best solution.
+        """
+        pass
+
+    def get_shared(self):
+        """
+        (cost, rows) of a solution found somewhere else, or None.
+        """
+        return None
+
+    def must_stop(self) -> bool:
+        return False
+
+    @staticmethod
+    def get_neighbours(evaluator: IncrementalEvaluator, rnd: random.Random) -> list:
+        """
+        functions that return a random move of each neighbourhood.
+        """
+        teams, slots = evaluator.teams, evaluator.slots
+        return [
+            lambda: evaluator.swap_home_away(*rnd.sample(teams, 2)),
+            lambda: evaluator.swap_slots(*rnd.sample(slots, 2)),
+            lambda: evaluator.swap_teams(*rnd.sample(teams, 2)),
+            lambda: evaluator.partial_swap_slots(
+                rnd.choice(teams), *rnd.sample(slots, 2)
+            ),
+            lambda: evaluator.partial_swap_teams(
+                *rnd.sample(teams, 2), rnd.choice(slots)
+            ),
+        ]
+
+    @staticmethod
+    def initial_temperature(
+        evaluator: IncrementalEvaluator, neighbours: list, rnd: random.Random
+    ) -> float:
+        """
+        mean cost increase of a sample of random moves.
+        """
+        increases = []
+        for _ in range(SAMPLE_MOVES):
+            move = rnd.choice(neighbours)()
+            if move is None:
+                continue
+            delta = cost(*evaluator.delta(move))
+            if delta > 0:
+                increases.append(delta)
+        if not increases:
+            return 1
+        return sum(increases) / len(increases)
+
+
+def cost(objective, infeasibility) -> float:
+    return objective + HARD_WEIGHT * infeasibility
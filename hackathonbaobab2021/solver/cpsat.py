@@ -0,0 +1,404 @@
+from ..core import Experiment, Instance, Solution
+from ..core.constants import HOME, AWAY, SOFT, HARD, GLOBAL, EVERY
+from cornflow_client.constants import (
+    STATUS_OPTIMAL,
+    STATUS_TIME_LIMIT,
+    STATUS_INFEASIBLE,
+    STATUS_NOT_SOLVED,
+    STATUS_UNDEFINED,
+    SOLUTION_STATUS_FEASIBLE,
+    SOLUTION_STATUS_INFEASIBLE,
+)
+
+TAGS = ["CA1", "CA2", "CA3", "CA4", "GA1", "SE1", "BR1", "BR2", "FA2"]
+
+
+class CPSatModel(object):
+    """
+    CP-SAT model of an Instance, with the same constraint semantics as
+    the Experiment.check_* functions (including their quirks):
+
+    * every pair of teams meets once at home and once away and every team plays
+        at most once per slot (exactly once if the tournament is compact).
+    * HARD constraints are constraints of the model, unless hard_weight is given.
+        Then, they are penalized as SOFT constraints with hard_weight as penalty.
+    * SOFT constraints get a slack variable for their deviation, penalized
+        in the objective as in Experiment.get_objective.
+
+    Only the constraints in the categories in tags are built.
+    x[home, away, slot] is True if the match is played in the slot.
+    """
+
+    def __init__(self, instance: Instance, hard_weight: int = None, tags=TAGS):
+        # ortools is only needed by this solver (see the solvers extras)
+        from ortools.sat.python import cp_model
+
+        self.instance = instance
+        self.hard_weight = hard_weight
+        self.model = cp_model.CpModel()
+        self.index = instance.get_index()
+        self.teams = self.index.teams
+        self.slots = self.index.slots
+        self.slot_pos = self.index.slot_pos
+        self.x = {
+            (home, away, slot): self.model.NewBoolVar(
+                "x_{}_{}_{}".format(home, away, slot)
+            )
+            for home in self.teams
+            for away in self.teams
+            if home != away
+            for slot in self.slots
+        }
+        self.home = {
+            (team, slot): sum(self.x[team, rival, slot] for rival in self._rivals(team))
+            for team in self.teams
+            for slot in self.slots
+        }
+        self.away = {
+            (team, slot): sum(self.x[rival, team, slot] for rival in self._rivals(team))
+            for team in self.teams
+            for slot in self.slots
+        }
+        self._changes = dict()
+        # penalized slacks of the objective
+        self.objective = []
+        self._build_round_robin()
+        for tag in tags:
+            func = getattr(self, "_build_" + tag)
+            for k, c in self.instance.get_constraint(tag).items():
+                penalty = self.instance.get_penalty(tag, k)
+                if c["type"] == HARD and hard_weight is not None:
+                    penalty = hard_weight
+                func(k, c, penalty)
+        self.model.Minimize(sum(self.objective))
+
+    def _is_hard(self, constraint) -> bool:
+        return constraint["type"] != SOFT and self.hard_weight is None
+
+    def _rivals(self, team):
+        return [rival for rival in self.teams if rival != team]
+
+    def _match(self, team, rival, slot, modes):
+        """
+        the matches of team against rival in slot, in modes (as seen by team)
+        """
+        if team == rival or (team, rival, slot) not in self.x:
+            return []
+        result = []
+        if HOME in modes:
+            result.append(self.x[team, rival, slot])
+        if AWAY in modes:
+            result.append(self.x[rival, team, slot])
+        return result
+
+    def _change(self, team, pos, mode):
+        """
+        True if the team changes to mode in the slot in position pos, as
+        counted by Experiment.count_breaks.
+        It is only bounded from below: constraints only limit the number of breaks.
+        """
+        key = team, pos, mode
+        if key in self._changes:
+            return self._changes[key]
+        status = self.home if mode == HOME else self.away
+        slot, prev = self.slots[pos], self.slots[pos - 1]
+        var = self.model.NewBoolVar("break_{}_{}_{}".format(team, pos, mode))
+        self.model.Add(var >= status[team, slot] - status[team, prev])
+        self._changes[key] = var
+        return var
+
+    def _add_bounds(self, value, upper: int, constraint: dict, penalty, sides):
+        """
+        value (between 0 and upper) has to be between the min and the max
+        of the constraint (sides says which ones).
+        A SOFT deviation is penalized as in experiment.compare.
+        """
+        _max = constraint.get("max") if "max" in sides else None
+        _min = constraint.get("min") if "min" in sides else None
+        hard = self._is_hard(constraint)
+        if _max is not None and upper > _max:
+            if hard:
+                self.model.Add(value <= _max)
+            else:
+                slack = self.model.NewIntVar(0, upper - _max, "")
+                self.model.Add(slack >= value - _max)
+                self.objective.append(penalty * slack)
+        if _min is not None and _min > 0:
+            if hard:
+                self.model.Add(value >= _min)
+            else:
+                slack = self.model.NewIntVar(0, _min, "")
+                self.model.Add(slack >= _min - value)
+                self.objective.append(penalty * slack)
+
+    def _build_round_robin(self):
+        compact = len(self.slots) == 2 * (len(self.teams) - 1)
+        for home in self.teams:
+            for away in self._rivals(home):
+                self.model.AddExactlyOne(
+                    self.x[home, away, slot] for slot in self.slots
+                )
+        for team in self.teams:
+            for slot in self.slots:
+                matches = [
+                    self.x[home, away, slot]
+                    for rival in self._rivals(team)
+                    for home, away in [(team, rival), (rival, team)]
+                ]
+                if compact:
+                    self.model.AddExactlyOne(matches)
+                else:
+                    self.model.AddAtMostOne(matches)
+
+    def _build_CA1(self, k, c, penalty):
+        # check_CA1 compares each (team, slot) on its own
+        status = self.home if c["mode"] == HOME else self.away
+        for team in set(c["teams"]):
+            for slot in set(c["slots"]):
+                self._add_bounds(status[team, slot], 1, c, penalty, ["min", "max"])
+
+    def _build_CA2(self, k, c, penalty):
+        # check_CA2 expands the matches with mode2, i.e., home and away
+        for team in set(c["teams1"]):
+            value = [
+                var
+                for rival in set(c["teams2"])
+                for slot in set(c["slots"])
+                for var in self._match(team, rival, slot, [HOME, AWAY])
+            ]
+            self._add_bounds(sum(value), len(value), c, penalty, ["min", "max"])
+
+    def _build_CA3(self, k, c, penalty):
+        modes = [c["mode1"]] if c["mode1"] in [HOME, AWAY] else [HOME, AWAY]
+        windows = self.index.get("CA3", k)["windows"]
+        for team in set(c["teams1"]):
+            for start, slots in windows.items():
+                value = [
+                    var
+                    for rival in set(c["teams2"])
+                    for slot in slots
+                    for var in self._match(team, rival, slot, modes)
+                ]
+                upper = len(value)
+                if upper <= c["max"]:
+                    continue
+                value = sum(value)
+                if self._is_hard(c):
+                    self.model.Add(value <= c["max"])
+                    continue
+                # check_CA3 keeps the number of matches, not the deviation
+                violated = self.model.NewBoolVar("")
+                self.model.Add(value <= c["max"]).OnlyEnforceIf(violated.Not())
+                slack = self.model.NewIntVar(0, upper, "")
+                self.model.Add(slack >= value).OnlyEnforceIf(violated)
+                self.objective.append(penalty * slack)
+
+    def _build_CA4(self, k, c, penalty):
+        # check_CA4 expands the matches with mode2, i.e., home and away
+        pairs = set(
+            match
+            for team1 in c["teams1"]
+            for team2 in c["teams2"]
+            if team1 != team2
+            for match in [(team1, team2), (team2, team1)]
+        )
+        slots = set(c["slots"])
+        if c["mode2"] == GLOBAL:
+            groups = [slots]
+        elif c["mode2"] == EVERY:
+            groups = [[slot] for slot in slots]
+        else:
+            return
+        for group in groups:
+            value = [self.x[home, away, slot] for home, away in pairs for slot in group]
+            self._add_bounds(sum(value), len(value), c, penalty, ["max"])
+
+    def _build_GA1(self, k, c, penalty):
+        compiled = self.index.get("GA1", k)
+        value = [
+            self.x[home, away, slot]
+            for home, away in compiled["meetings_set"]
+            for slot in compiled["slots_set"]
+        ]
+        if value:
+            self._add_bounds(sum(value), len(value), c, penalty, ["min", "max"])
+
+    def _build_SE1(self, k, c, penalty):
+        for team1, team2 in self.index.get("SE1", k)["pairs"]:
+            pos1, pos2 = [
+                sum(
+                    self.slot_pos[slot] * self.x[home, away, slot]
+                    for slot in self.slots
+                )
+                for home, away in [(team1, team2), (team2, team1)]
+            ]
+            dist = self.model.NewIntVar(0, len(self.slots), "")
+            self.model.AddAbsEquality(dist, pos1 - pos2)
+            self._add_bounds(dist, len(self.slots), c, penalty, ["min"])
+
+    def _build_BR1(self, k, c, penalty):
+        modes = [c["mode2"]] if c["mode2"] in [HOME, AWAY] else [HOME, AWAY]
+        positions = set(self.slot_pos[slot] for slot in c["slots"]) - {0}
+        for team in set(c["teams"]):
+            value = [
+                self._change(team, pos, mode) for pos in positions for mode in modes
+            ]
+            self._add_bounds(
+                sum(value), len(value), dict(c, max=c["intp"]), penalty, ["max"]
+            )
+
+    def _build_BR2(self, k, c, penalty):
+        positions = set(self.slot_pos[slot] for slot in c["slots"]) - {0}
+        value = [
+            self._change(team, pos, mode)
+            for team in set(c["teams"])
+            for pos in positions
+            for mode in [HOME, AWAY]
+        ]
+        self._add_bounds(
+            sum(value), len(value), dict(c, max=c["intp"]), penalty, ["max"]
+        )
+
+    def _build_FA2(self, k, c, penalty):
+        last = max(self.slot_pos[slot] for slot in c["slots"])
+        acc = dict()
+        for team in set(c["teams"]):
+            _acc = 0
+            for slot in self.slots[: last + 1]:
+                _acc += self.home[team, slot]
+                acc[team, slot] = _acc
+        hard = self._is_hard(c)
+        for team1, team2 in self.index.get("FA2", k)["pairs"]:
+            if not hard:
+                # check_FA2 keeps the maximum difference of the pair
+                slack = self.model.NewIntVar(0, len(self.slots), "")
+                self.objective.append(penalty * slack)
+            for slot in set(c["slots"]):
+                diff = acc[team1, slot] - acc[team2, slot]
+                for value in [diff, -diff]:
+                    if hard:
+                        self.model.Add(value <= c["intp"])
+                    else:
+                        self.model.Add(slack >= value - c["intp"])
+
+    def fix(self, rows) -> None:
+        """
+        the (home, away, slot) rows are forced in the model.
+        """
+        for row in rows:
+            if row not in self.x:
+                raise ValueError("match {} cannot be in the model".format(row))
+            self.model.Add(self.x[row] == 1)
+
+    def hint(self, rows) -> None:
+        """
+        the (home, away, slot) rows are used as a hint for the search.
+        """
+        rows = set(rows)
+        self.model.ClearHints()
+        for row, var in self.x.items():
+            self.model.AddHint(var, int(row in rows))
+
+    def get_submodel(self, fixed, hint=None):
+        """
+        a copy of the model where the (home, away, slot) rows in fixed are forced.
+
+        :param hint: (home, away, slot) rows used as a hint for the search
+        """
+        model = self.model.Clone()
+        for row in fixed:
+            model.Add(model.GetBoolVarFromProtoIndex(self.x[row].Index()) == 1)
+        if hint is not None:
+            hint = set(hint)
+            model.ClearHints()
+            for row, var in self.x.items():
+                model.AddHint(
+                    model.GetBoolVarFromProtoIndex(var.Index()), int(row in hint)
+                )
+        return model
+
+    def get_rows(self, solver) -> list:
+        """
+        the (home, away, slot) rows of the solution in the solver.
+        """
+        return [row for row, var in self.x.items() if solver.BooleanValue(var)]
+
+
+class CPSat(Experiment):
+    """
+    Solves the CPSatModel of the instance with CP-SAT.
+
+    options:
+
+    * timeLimit: seconds of search.
+    * threads: number of search workers.
+    * gapRel / gapAbs: the search stops when the relative / absolute gap is reached.
+    * seed: random seed of the solver.
+    * warmStart: if True, the solution of the experiment is used as a hint.
+    * fixSolution: if True, the matches in the solution of the experiment are fixed.
+    * msg: if True, the search log is shown.
+    * logPath: if given, the search log is written in this file.
+    """
+
+    def solve(self, options: dict) -> dict:
+        from ortools.sat.python import cp_model
+
+        model = CPSatModel(self.instance)
+        rows = self.solution.get_home_away_slot()
+        if options.get("warmStart") and len(rows):
+            model.hint(rows)
+        if options.get("fixSolution"):
+            model.fix(rows)
+
+        solver, status = solve_model(model.model, options)
+        self.stats = dict(
+            status=solver.StatusName(status),
+            time=solver.WallTime(),
+            branches=solver.NumBranches(),
+        )
+        if status not in [cp_model.OPTIMAL, cp_model.FEASIBLE]:
+            status_conv = {
+                cp_model.INFEASIBLE: STATUS_INFEASIBLE,
+                cp_model.UNKNOWN: STATUS_NOT_SOLVED,
+            }
+            return dict(
+                status=status_conv.get(status, STATUS_UNDEFINED),
+                status_sol=SOLUTION_STATUS_INFEASIBLE,
+                log=self.stats,
+            )
+        self.stats.update(
+            objective=solver.ObjectiveValue(), bound=solver.BestObjectiveBound()
+        )
+        self.solution = Solution.from_rows(model.get_rows(solver))
+        status = STATUS_OPTIMAL if status == cp_model.OPTIMAL else STATUS_TIME_LIMIT
+        return dict(status=status, status_sol=SOLUTION_STATUS_FEASIBLE, log=self.stats)
+
+
+def solve_model(model, options: dict):
+    """
+    solves a CP-SAT model with the options of the CPSat solver.
+
+    :return: the CpSolver and the status of the solution
+    """
+    from ortools.sat.python import cp_model
+
+    solver = cp_model.CpSolver()
+    params = solver.parameters
+    if options.get("timeLimit") is not None:
+        params.max_time_in_seconds = options["timeLimit"]
+    if options.get("threads"):
+        params.num_workers = options["threads"]
+    if options.get("gapRel") is not None:
+        params.relative_gap_limit = options["gapRel"]
+    if options.get("gapAbs") is not None:
+        params.absolute_gap_limit = options["gapAbs"]
+    if options.get("seed") is not None:
+        params.random_seed = options["seed"]
+    log_path = options.get("logPath")
+    params.log_search_progress = bool(options.get("msg") or log_path)
+    params.log_to_stdout = bool(options.get("msg"))
+    if not log_path:
+        return solver, solver.Solve(model)
+    with open(log_path, "w") as f:
+        solver.log_callback = lambda line: f.write(line + "\n")
+        return solver, solver.Solve(model)
@@ -37,7 +37,7 @@ class Default(Experiment):
                 if match is None:
                     # we give up looking
                     match = find_match(remaining, already_scheduled, False)
-                solution.append(dict(home=match[0], away=match[1], slot=slot))
+                solution.append((match[0], match[1], slot))
 
-        self.solution = Solution(dict(assignment=solution))
+        self.solution = Solution.from_rows(solution)
         return dict(status=STATUS_UNDEFINED, status_sol=SOLUTION_STATUS_FEASIBLE)
@@ -0,0 +1,123 @@
+from ..core import Experiment, Solution
+from ..core.constants import SOFT
+from ..core.evaluator import OWN_CHECKS
+from .annealing import HARD_WEIGHT, cost
+from .cpsat import CPSatModel
+from .polish import Polish
+from pytups import SuperDict
+import random
+
+# share of the neighbourhoods that are chosen at random
+RANDOM_PROBABILITY = 0.2
+
+
+class LNS(Polish):
+    """
+    Large neighbourhood search with CP-SAT as exact sub solver.
+    It works as Polish (see its options), except:
+
+    * it starts from a RoundRobin solution unless warmStart is True.
+    * the freed window of slots or subset of teams is built around the teams
+        and slots of one of the violated constraints of the current solution.
+        It's chosen with a probability proportional to its penalized violation
+        (HARD violations weigh HARD_WEIGHT).
+    * a new solution is kept if get_objective, plus HARD_WEIGHT times
+        the number of HARD violations, improves.
+    * by default, it runs until the timeLimit (no lnsStall).
+    """
+
+    default_stall = None
+
+    def solve(self, options: dict) -> dict:
+        if not options.get("warmStart"):
+            self.solution = Solution.from_rows([])
+        # last evaluated rows and the violations of the current rows
+        self._evaluated = None
+        self._violations = None
+        return super().solve(options)
+
+    def evaluate(self, model: CPSatModel, rows, solver=None) -> float:
+        experiment = Experiment(self.instance, Solution.from_rows(rows))
+        self._evaluated = rows, experiment
+        infeasibility = sum(experiment.check_solution().to_lendict().values())
+        return cost(experiment.get_objective(), infeasibility)
+
+    def get_violations(self, rows) -> SuperDict:
+        """
+        (check, constraint id, *key): penalized violation of the rows.
+        """
+        if self._violations is not None and self._violations[0] is rows:
+            return self._violations[1]
+        if self._evaluated is not None and self._evaluated[0] is rows:
+            experiment = self._evaluated[1]
+        else:
+            experiment = Experiment(self.instance, Solution.from_rows(rows))
+        get_tag = lambda name: name.split("_")[0]
+        soft = (
+            experiment.check_solution(c_type=SOFT)
+            .to_dictdict()
+            .to_dictup()
+            .kvapply(
+                lambda k, v: abs(v) * self.instance.get_penalty(get_tag(k[0]), k[1])
+            )
+        )
+        hard = (
+            experiment.check_solution()
+            .kfilter(lambda k: k not in OWN_CHECKS)
+            .to_dictdict()
+            .to_dictup()
+            .vapply(lambda v: HARD_WEIGHT)
+        )
+        violations = soft._update(hard)
+        self._violations = rows, violations
+        return violations
+
+    def get_focus(self, key) -> tuple:
+        """
+        the teams and the slots involved in the violation of key.
+        """
+        name, k, rest = key[0], key[1], key[2:]
+        tag = name.split("_")[0]
+        c = self.instance.get_constraint(tag)[k]
+        teams = set(c.get("teams", [])) | set(c.get("teams1", []))
+        slots = set(c.get("slots", []))
+        if tag in ["CA1", "CA2", "CA3", "BR1"]:
+            teams = {rest[0]}
+        if tag == "CA1":
+            slots = {rest[1]}
+        elif tag == "CA3":
+            slots = set(self.instance.get_index().get(tag, k)["windows"][rest[1]])
+        elif name == "CA4_slots":
+            slots = {rest[0]}
+        elif tag == "GA1":
+            teams = {team for meeting in c["meetings"] for team in meeting}
+        elif tag == "SE1":
+            teams = set(rest)
+        elif tag == "FA2":
+            teams = set(rest[0])
+        return teams, slots
+
+    def get_neighbourhood(self, rows, rnd: random.Random, options: dict):
+        """
+        a window of consecutive slots or a subset of teams around one of the
+        violations of the rows. Sometimes (or if there are no violations),
+        a random one.
+        """
+        violations = self.get_violations(rows)
+        if not len(violations) or rnd.random() < RANDOM_PROBABILITY:
+            return super().get_neighbourhood(rows, rnd, options)
+        keys = violations.keys_tl()
+        key = rnd.choices(keys, weights=[violations[k] for k in keys])[0]
+        teams, slots = self.get_focus(key)
+        all_slots = list(self.instance.slots)
+        if slots and (not teams or rnd.random() < 0.5):
+            size = min(options.get("lnsSlots", 4), len(all_slots))
+            pos = all_slots.index(rnd.choice(sorted(slots)))
+            first = min(max(pos - rnd.randrange(size), 0), len(all_slots) - size)
+            return set(all_slots[first : first + size]), set()
+        all_teams = self.instance.get_teams().keys_tl()
+        size = min(options.get("lnsTeams", 3), len(all_teams))
+        chosen = rnd.sample(sorted(teams), min(size, len(teams)))
+        others = [team for team in all_teams if team not in chosen]
+        chosen += rnd.sample(others, size - len(chosen))
+        return set(), set(chosen)
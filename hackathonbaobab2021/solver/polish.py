@@ -0,0 +1,163 @@
+from ..core import Experiment, Instance, Solution
+from .annealing import HARD_WEIGHT
+from .cpsat import CPSatModel, solve_model
+from .round_robin import RoundRobin, is_double_round_robin
+from cornflow_client.constants import (
+    STATUS_TIME_LIMIT,
+    STATUS_UNDEFINED,
+    SOLUTION_STATUS_FEASIBLE,
+)
+from timeit import default_timer as timer
+import random
+import math
+
+
+def repair(instance: Instance, rows, options: dict = None) -> list:
+    """
+    the double round robin closest to rows: every pair of teams meets once
+    at home and once away, every team plays at most once per slot and
+    as many (home, away, slot) rows as possible are kept.
+    The constraints of the instance are not taken into account.
+
+    :param options: options for the CP-SAT solver (see solve_model)
+    :return: the (home, away, slot) rows of the double round robin
+    """
+    from ortools.sat.python import cp_model
+
+    model = CPSatModel(instance, tags=[])
+    rows = set(rows)
+    model.model.Maximize(sum(var for row, var in model.x.items() if row in rows))
+    model.hint(rows)
+    solver, status = solve_model(model.model, options or {})
+    if status not in [cp_model.OPTIMAL, cp_model.FEASIBLE]:
+        raise ValueError("the solution could not be repaired")
+    return model.get_rows(solver)
+
+
+class Polish(Experiment):
+    """
+    Improves the solution of the experiment (warm start):
+
+    1. if it is not a double round robin (see is_double_round_robin),
+        it's replaced by the closest one (see repair).
+        If there is no solution, it starts from a RoundRobin one.
+    2. a large neighbourhood search frees the matches in a window of consecutive
+        slots, or the matches of a subset of teams, and solves the CPSatModel
+        with the rest of the matches fixed. HARD constraints are penalized
+        with HARD_WEIGHT so the sub problems are always feasible.
+        A new solution is kept if it is better than the current one.
+
+    options:
+
+    * timeLimit: seconds of search.
+    * seed: seed for the random numbers.
+    * threads: number of search workers of each sub problem.
+    * gapAbs: the search stops when the cost is at most gapAbs.
+    * lnsSlots: number of slots of each window (4 by default).
+    * lnsTeams: number of teams of each subset (3 by default).
+    * lnsTimeLimit: seconds for each sub problem (1 by default).
+    * lnsStall: the search stops after this number of sub problems
+        without improvement (10 by default).
+    """
+
+    # default value of the lnsStall option (None: no limit)
+    default_stall = 10
+
+    def solve(self, options: dict) -> dict:
+        from ortools.sat.python import cp_model
+
+        start = timer()
+        time_limit = options.get("timeLimit", 10)
+        rnd = random.Random(options.get("seed"))
+        self.stats = dict(repaired=0, iterations=0, improvements=0)
+        rows = self.get_initial_rows(rnd)
+        model = CPSatModel(self.instance, hard_weight=HARD_WEIGHT)
+        current = self.evaluate(model, rows)
+        max_stall = options.get("lnsStall", self.default_stall)
+        stall = 0
+        time_out = False
+        while (max_stall is None or stall < max_stall) and current > options.get(
+            "gapAbs", 0
+        ):
+            remaining = time_limit - (timer() - start)
+            if remaining <= 0:
+                time_out = True
+                break
+            slots, teams = self.get_neighbourhood(rows, rnd, options)
+            fixed = [
+                (home, away, slot)
+                for home, away, slot in rows
+                if slot not in slots and home not in teams and away not in teams
+            ]
+            sub_options = dict(
+                timeLimit=min(options.get("lnsTimeLimit", 1), remaining),
+                threads=options.get("threads"),
+                seed=rnd.randrange(1000000),
+            )
+            solver, status = solve_model(
+                model.get_submodel(fixed, hint=rows), sub_options
+            )
+            self.stats["iterations"] += 1
+            stall += 1
+            if status not in [cp_model.OPTIMAL, cp_model.FEASIBLE]:
+                continue
+            candidate = model.get_rows(solver)
+            value = self.evaluate(model, candidate, solver)
+            if value < current:
+                rows, current = candidate, value
+                self.stats["improvements"] += 1
+                stall = 0
+
+        self.solution = Solution.from_rows(rows)
+        self.stats.update(cost=current, time=timer() - start)
+        return dict(
+            status=STATUS_TIME_LIMIT if time_out else STATUS_UNDEFINED,
+            status_sol=SOLUTION_STATUS_FEASIBLE,
+            log=self.stats,
+        )
+
+    def get_initial_rows(self, rnd: random.Random) -> list:
+        """
+        the (home, away, slot) rows of the solution, repaired if needed.
+        """
+        rows = self.solution.get_home_away_slot()
+        if not len(rows):
+            initial = RoundRobin(self.instance)
+            initial.solve(dict(seed=rnd.randrange(1000000)))
+            return initial.solution.get_home_away_slot()
+        if is_double_round_robin(self.instance, rows):
+            return rows
+        repaired = repair(self.instance, rows)
+        self.stats["repaired"] = len(set(rows) - set(repaired))
+        return repaired
+
+    def evaluate(self, model: CPSatModel, rows, solver=None) -> float:
+        """
+        objective of the model for the (home, away, slot) rows
+        (infinite if they are not a solution of the model).
+
+        :param solver: if given, the CpSolver that found the rows
+        """
+        from ortools.sat.python import cp_model
+
+        if solver is None:
+            solver, status = solve_model(model.get_submodel(rows), dict())
+            if status not in [cp_model.OPTIMAL, cp_model.FEASIBLE]:
+                return math.inf
+        return solver.ObjectiveValue()
+
+    def get_neighbourhood(self, rows, rnd: random.Random, options: dict):
+        """
+        the slots and the teams whose matches are freed: a random window
+        of consecutive slots or a random subset of teams.
+
+        :param rows: the (home, away, slot) rows of the current solution
+        """
+        slots = list(self.instance.slots)
+        teams = self.instance.get_teams().keys_tl()
+        if rnd.random() < 0.5:
+            size = min(options.get("lnsSlots", 4), len(slots))
+            first = rnd.randrange(len(slots) - size + 1)
+            return set(slots[first : first + size]), set()
+        size = min(options.get("lnsTeams", 3), len(teams))
+        return set(), set(rnd.sample(teams, size))
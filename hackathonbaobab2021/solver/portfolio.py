@@ -0,0 +1,166 @@
+from ..core import Experiment, Instance, Solution
+from .annealing import Annealing
+from .round_robin import MIRRORED, FRENCH, ENGLISH, INVERTED
+from cornflow_client.constants import (
+    STATUS_TIME_LIMIT,
+    SOLUTION_STATUS_FEASIBLE,
+)
+from timeit import default_timer as timer
+from queue import Empty
+import multiprocessing as mp
+import traceback
+import math
+
+# each worker starts from a different pattern
+PATTERNS = [MIRRORED, FRENCH, ENGLISH, INVERTED]
+# extra seconds to wait for the workers after the timeLimit
+TIME_LIMIT_MARGIN = 5
+
+
+class Portfolio(Experiment):
+    """
+    Runs threads Annealing searches in parallel processes, each one with its
+    own seed and initial pattern.
+    Every time a worker improves the best known solution, it is sent to the
+    main process, that forwards it to the other workers.
+    Workers continue from it if it is better than their current solution.
+
+    options:
+
+    * threads: number of processes (1 by default).
+    * timeLimit: seconds of search.
+    * seed: seed of the first worker, the rest use the next ones.
+    * gapAbs: the search stops when the best cost is at most gapAbs
+        (the only bound known is zero).
+    * the rest of the options are passed to Annealing.
+
+    Workers that fail or do not finish are reported in the failed stats,
+    with their error or exit code.
+    If no worker returns a solution, it raises a ValueError.
+    """
+
+    def solve(self, options: dict) -> dict:
+        start = timer()
+        num_workers = max(1, options.get("threads") or 1)
+        time_limit = options.get("timeLimit", 10)
+        gap_abs = options.get("gapAbs", 0)
+        seed = options.get("seed") or 0
+        context = mp.get_context()
+        outbox = context.Queue()
+        inboxes = [context.Queue() for _ in range(num_workers)]
+        stop = context.Event()
+        data = self.instance.to_dict()
+        solution = None
+        if self.solution is not None and len(self.solution):
+            solution = self.solution.to_dict()
+
+        processes = []
+        for worker in range(num_workers):
+            worker_options = dict(
+                options,
+                seed=seed + worker,
+                pattern=PATTERNS[worker % len(PATTERNS)],
+                timeLimit=time_limit - (timer() - start),
+            )
+            args = (worker, data, solution, worker_options, inboxes[worker], outbox)
+            process = context.Process(target=_run_worker, args=args + (stop,))
+            process.start()
+            processes.append(process)
+
+        best, best_rows, best_worker = math.inf, None, None
+        stats = dict()
+        errors = dict()
+        deadline = start + time_limit + TIME_LIMIT_MARGIN
+        while len(stats) + len(errors) < num_workers and timer() < deadline:
+            try:
+                message, worker, value, rows = outbox.get(timeout=0.1)
+            except Empty:
+                if not any(p.is_alive() for p in processes) and outbox.empty():
+                    break
+                continue
+            if message == "done":
+                stats[worker] = value
+                continue
+            if message == "error":
+                errors[worker] = value
+                continue
+            if value >= best:
+                continue
+            best, best_rows, best_worker = value, rows, worker
+            for other, inbox in enumerate(inboxes):
+                if other != worker:
+                    inbox.put((best, best_rows))
+            if best <= gap_abs:
+                stop.set()
+        stop.set()
+        # messages that nobody will read should not block the exit
+        for inbox in inboxes:
+            inbox.close()
+            inbox.cancel_join_thread()
+        for process in processes:
+            process.join(timeout=TIME_LIMIT_MARGIN)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        failed = {
+            worker: errors.get(worker)
+            or "exit code {}".format(processes[worker].exitcode)
+            for worker in range(num_workers)
+            if worker not in stats
+        }
+
+        if not best_rows:
+            raise ValueError("no worker returned a solution: {}".format(failed))
+        self.solution = Solution.from_rows(best_rows)
+        self.stats = dict(
+            cost=best,
+            best_worker=best_worker,
+            workers={worker: stats.get(worker) for worker in range(num_workers)},
+            failed=failed,
+        )
+        return dict(
+            status=STATUS_TIME_LIMIT,
+            status_sol=SOLUTION_STATUS_FEASIBLE,
+            log=self.stats,
+        )
+
+
+class _SharedAnnealing(Annealing):
+    """
+    Annealing that shares its best solutions through the queues of a Portfolio.
+    """
+
+    def __init__(self, instance, solution, worker, inbox, outbox, stop):
+        super().__init__(instance, solution)
+        self.worker = worker
+        self.inbox = inbox
+        self.outbox = outbox
+        self.stop = stop
+
+    def on_best(self, best, rows):
+        self.outbox.put(("best", self.worker, best, rows))
+
+    def get_shared(self):
+        shared = None
+        # we only keep the last one, the best
+        while True:
+            try:
+                shared = self.inbox.get_nowait()
+            except Empty:
+                return shared
+
+    def must_stop(self):
+        return self.stop.is_set()
+
+
+def _run_worker(worker, data, solution, options, inbox, outbox, stop):
+    instance = Instance.from_dict(data)
+    if solution is not None:
+        solution = Solution.from_dict(solution)
+    solver = _SharedAnnealing(instance, solution, worker, inbox, outbox, stop)
+    try:
+        solver.solve(options)
+    except Exception:
+        outbox.put(("error", worker, traceback.format_exc(), None))
+        return
+    outbox.put(("done", worker, solver.stats, None))
@@ -0,0 +1,114 @@
+from ..core import Experiment, Instance, Solution
+from cornflow_client.constants import (
+    STATUS_UNDEFINED,
+    SOLUTION_STATUS_FEASIBLE,
+)
+from itertools import permutations
+import random
+
+MIRRORED = "mirrored"
+FRENCH = "french"
+ENGLISH = "english"
+INVERTED = "inverted"
+
+
+def circle_method(num_teams: int) -> list:
+    """
+    single round robin with the circle (polygon) method and the canonical
+    home-away pattern, which has the minimum number of breaks.
+
+    :param num_teams: an even number of teams
+    :return: a list of rounds, each one a list of (home, away) positions
+    """
+    last = num_teams - 1
+    rounds = []
+    for r in range(last):
+        # the last team is fixed in the center of the polygon
+        matches = [(r, last) if r % 2 == 0 else (last, r)]
+        for k in range(1, num_teams // 2):
+            team1, team2 = (r + k) % last, (r - k) % last
+            matches.append((team1, team2) if k % 2 == 1 else (team2, team1))
+        rounds.append(matches)
+    return rounds
+
+
+def double_round_robin(num_teams: int, pattern: str = MIRRORED) -> list:
+    """
+    double round robin where the second half plays the matches of the first
+    half with the venues swapped, in an order given by pattern:
+
+    * mirrored: the same order as the first half.
+    * french: the first round of the first half is played last.
+    * english: the last round of the first half is played first.
+    * inverted: the reverse order of the first half.
+
+    If num_teams is odd, a dummy team is added and its matches are byes.
+
+    :return: a list of rounds, each one a list of (home, away) positions
+    """
+    size = num_teams + num_teams % 2
+    first = circle_method(size)
+    last = len(first) - 1
+    order = {
+        MIRRORED: list(range(last + 1)),
+        FRENCH: list(range(1, last + 1)) + [0],
+        ENGLISH: [last] + list(range(last)),
+        INVERTED: list(range(last, -1, -1)),
+    }
+    if pattern not in order:
+        raise ValueError("unknown pattern: {}".format(pattern))
+    second = [[(away, home) for home, away in first[r]] for r in order[pattern]]
+    return [
+        [(home, away) for home, away in matches if max(home, away) < num_teams]
+        for matches in first + second
+    ]
+
+
+def is_double_round_robin(instance: Instance, rows) -> bool:
+    """
+    True if, in the (home, away, slot) rows, every pair of teams of the instance
+    meets exactly once at home and once away, in slots of the instance,
+    and every team plays at most once per slot.
+    This is stricter than the num_home, num_away and one_match_slot checks,
+    that pass if a pair meets twice with the same venues.
+    """
+    rows = list(rows)
+    pairs = set(permutations(instance.get_teams().keys_tl(), 2))
+    if len(rows) != len(pairs) or {(h, a) for h, a, s in rows} != pairs:
+        return False
+    if not {s for h, a, s in rows} <= set(instance.slots):
+        return False
+    team_slots = {(team, s) for h, a, s in rows for team in (h, a)}
+    return len(team_slots) == 2 * len(rows)
+
+
+class RoundRobin(Experiment):
+    """
+    Builds a double round robin with the circle method.
+    Every team plays once per slot and meets every other team once at home
+    and once away. The constraints in the instance are not taken into account.
+
+    options:
+
+    * pattern: order of the second half (see double_round_robin).
+    * seed: if given, the teams are randomly assigned to the positions
+        in the polygon with this seed.
+    """
+
+    def solve(self, options: dict) -> dict:
+        teams = self.instance.get_teams().keys_tl()
+        slots = self.instance.slots
+        seed = options.get("seed")
+        if seed is not None:
+            random.Random(seed).shuffle(teams)
+        rounds = double_round_robin(len(teams), options.get("pattern", MIRRORED))
+        if len(rounds) > len(slots):
+            raise ValueError(
+                "{} slots are needed and there are {}".format(len(rounds), len(slots))
+            )
+        self.solution = Solution.from_rows(
+            (teams[home], teams[away], slot)
+            for matches, slot in zip(rounds, slots)
+            for home, away in matches
+        )
+        return dict(status=STATUS_UNDEFINED, status_sol=SOLUTION_STATUS_FEASIBLE)
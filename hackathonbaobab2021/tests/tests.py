@@ -2,11 +2,23 @@ import unittest
 from unittest.mock import patch, Mock, MagicMock
 import os
 import pickle
+import random
+import shutil
+import zipfile
+import io
+import numpy as np
 
 # we mock everything that's airflow related:
 from cornflow_client import SchemaManager, ApplicationCore
 from cornflow_client.airflow.dag_utilities import cf_solve
 from hackathonbaobab2021 import SportsScheduling
+from hackathonbaobab2021.core import IncrementalEvaluator, Experiment, DenseExperiment
+from hackathonbaobab2021.core import Batch, ZipBatch, tools
+from hackathonbaobab2021.core.experiment import (
+    apply_mode,
+    get_matches_slots_constraint,
+    window_sums,
+)
 
 
 class BaseDAGTests:
@@ -111,6 +123,208 @@ class SportsSchedulingTest(BaseDAGTests.SolvingTests):
     def test_default(self):
         self.test_try_solving_testcase(dict(solver="default", timeLimit=1, msg=False))
 
+    def test_round_robin(self):
+        self.test_try_solving_testcase(
+            dict(solver="round_robin", timeLimit=1, msg=False, seed=1)
+        )
+        for f in ["ITC2021_Test1", "ITC2021_Test2", "ITC2021_Test3"]:
+            path = os.path.join(os.path.dirname(__file__), "../data/{}.xml".format(f))
+            instance = self.app.instance.from_xml(path)
+            for pattern in ["mirrored", "french", "english", "inverted"]:
+                solver = self.app.get_solver("round_robin")(instance)
+                solver.solve(dict(pattern=pattern, seed=2))
+                errors = solver.check_solution()
+                for check in ["num_home", "num_away", "one_match_slot"]:
+                    self.assertNotIn(check, errors)
+        self.assertRaises(ValueError, solver.solve, dict(pattern="other"))
+
+    def test_portfolio(self):
+        self.test_try_solving_testcase(
+            dict(solver="portfolio", timeLimit=1, msg=False, threads=2)
+        )
+        path = os.path.join(os.path.dirname(__file__), "../data/ITC2021_Test2.xml")
+        instance = self.app.instance.from_xml(path)
+        solver = self.app.get_solver("portfolio")(instance)
+        output = solver.solve(dict(timeLimit=1, threads=2, seed=1))
+        self.assertEqual(set(output["log"]["workers"]), {0, 1})
+        self.assertEqual(output["log"]["cost"], solver.get_objective())
+        for stats in output["log"]["workers"].values():
+            self.assertGreater(stats["iterations"], 0)
+        errors = solver.check_solution()
+        for check in ["num_home", "num_away", "one_match_slot"]:
+            self.assertNotIn(check, errors)
+        self.assertEqual(output["log"]["failed"], {})
+        # the stats of the workers reach the log of the app
+        config = dict(solver="portfolio", timeLimit=1, msg=False, threads=2, seed=1)
+        solution, _, log = self.app.solve(instance.to_dict(), config)
+        self.assertEqual(set(log["log"]["workers"]), {0, 1})
+        self.assertEqual(log["log"]["failed"], {})
+        self.assertIn("cost", log["log"])
+        # warm start without a solution
+        solver = self.app.get_solver("portfolio")(instance)
+        solver.solve(dict(timeLimit=1, threads=2, seed=1, warmStart=True))
+        self.assertEqual(solver.check_solution(list_tests=[]), {})
+
+    def test_portfolio_failed_workers(self):
+        import multiprocessing as mp
+
+        if mp.get_start_method() != "fork":
+            self.skipTest("the workers only see the mock with fork")
+        path = os.path.join(os.path.dirname(__file__), "../data/ITC2021_Test2.xml")
+        instance = self.app.instance.from_xml(path)
+        solver = self.app.get_solver("portfolio")(instance)
+        target = "hackathonbaobab2021.solver.annealing.Annealing.solve"
+        with patch(target, side_effect=RuntimeError("worker failed")):
+            with self.assertRaises(ValueError) as context:
+                solver.solve(dict(timeLimit=1, threads=2, seed=1))
+        self.assertIn("worker failed", str(context.exception))
+
+    def test_cpsat(self):
+        from hackathonbaobab2021.execution.run_batch import solve_zip
+
+        self.test_try_solving_testcase(
+            dict(solver="cpsat", timeLimit=10, msg=False, threads=1)
+        )
+        path = os.path.join(os.path.dirname(__file__), "../data/ITC2021_Test1.xml")
+        data = self.app.instance.from_xml(path).to_dict()
+        for tag in ["CA1", "CA2", "CA3", "CA4", "GA1", "BR1", "BR2", "SE1", "FA2"]:
+            for constraint in data[tag]:
+                constraint["type"] = "SOFT"
+        instance = self.app.instance.from_dict(data)
+        # the objective of the model is the same as get_objective
+        for seed in range(3):
+            initial = self.app.get_solver("round_robin")(instance)
+            initial.solve(dict(seed=seed))
+            solver = self.app.get_solver("cpsat")(instance, initial.solution)
+            output = solver.solve(dict(fixSolution=True, timeLimit=10))
+            self.assertEqual(output["log"]["objective"], initial.get_objective())
+            self.assertEqual(solver.get_objective(), initial.get_objective())
+
+        # the results.log of the solver can be read by the Batch
+        name = "ITC2021_Test2.xml"
+        zip_path = os.path.join(self.tem_path, "instances_cpsat.zip")
+        with zipfile.ZipFile(zip_path, "w") as zip_obj:
+            zip_obj.write(
+                os.path.join(os.path.dirname(__file__), "../data", name), name
+            )
+        path_out = os.path.join(self.tem_path, "out_cpsat")
+        self.addCleanup(shutil.rmtree, path_out)
+        options = dict(timeLimit=30, threads=1)
+        solve_zip(
+            "instances_cpsat.zip",
+            path_out,
+            path_in=self.tem_path,
+            solver_name="cpsat",
+            options=options,
+        )
+        batch = Batch(path_out)
+        self.assertEqual(batch.get_solver(), "CPSAT")
+        experiment = batch.get_cases()["instances_cpsat", name]
+        self.assertEqual(experiment.check_solution(), {})
+        log = batch.get_logs()["instances_cpsat", name]
+        self.assertEqual(log["status"], "OPTIMAL")
+        self.assertEqual(log["best_solution"], experiment.get_objective())
+
+    def test_polish(self):
+        from hackathonbaobab2021.solver.annealing import HARD_WEIGHT
+        from hackathonbaobab2021.solver.cpsat import CPSatModel
+        from hackathonbaobab2021.solver.polish import repair
+
+        self.test_try_solving_testcase(
+            dict(solver="polish", timeLimit=2, msg=False, seed=1)
+        )
+        path = os.path.join(os.path.dirname(__file__), "../data/ITC2021_Test2.xml")
+        instance = self.app.instance.from_xml(path)
+        initial = self.app.get_solver("round_robin")(instance)
+        initial.solve(dict(seed=1))
+        rows = initial.solution.get_home_away_slot()
+        # we move the matches of the second slot to the first one
+        broken = (
+            rows[:3] + [(home, away, "0") for home, away, _ in rows[3:6]] + rows[6:]
+        )
+        repaired = repair(instance, broken)
+        self.assertEqual(len(set(broken) - set(repaired)), 3)
+        solution = self.app.solution.from_dict(
+            dict(assignment=[dict(home=h, away=a, slot=s) for h, a, s in broken])
+        )
+        solver = self.app.get_solver("polish")(instance, solution)
+        output = solver.solve(dict(timeLimit=10, seed=1))
+        self.assertEqual(output["log"]["repaired"], 3)
+        self.assertEqual(solver.check_solution(), {})
+        self.assertEqual(output["log"]["cost"], solver.get_objective())
+        self.assertLessEqual(solver.get_objective(), initial.get_objective())
+        # the own checks pass but three pairs meet twice with the same venues
+        t0, t1, t2 = instance.get_teams().keys_tl()[:3]
+        cycle = {(t0, t1), (t1, t2), (t2, t0)}
+        broken = [(a, h, s) if (h, a) in cycle else (h, a, s) for h, a, s in rows]
+        solution = self.app.solution.from_rows(broken)
+        solver = self.app.get_solver("polish")(instance, solution)
+        self.assertEqual(solver.check_solution(list_tests=[]), {})
+        model = CPSatModel(instance, hard_weight=HARD_WEIGHT)
+        self.assertEqual(solver.evaluate(model, broken), float("inf"))
+        output = solver.solve(dict(timeLimit=10, seed=1, lnsStall=2))
+        self.assertGreater(output["log"]["repaired"], 0)
+        self.assertEqual(solver.check_solution(), {})
+        self.assertEqual(output["log"]["cost"], solver.get_objective())
+
+    def test_lns(self):
+        from hackathonbaobab2021.solver.annealing import cost
+
+        self.test_try_solving_testcase(dict(solver="lns", timeLimit=2, msg=False))
+        path = os.path.join(os.path.dirname(__file__), "../data/ITC2021_Test3.xml")
+        instance = self.app.instance.from_xml(path)
+        solver = self.app.get_solver("lns")(instance)
+        output = solver.solve(dict(timeLimit=5, seed=1))
+        self.assertGreater(output["log"]["iterations"], 0)
+        errors = solver.check_solution()
+        for check in ["num_home", "num_away", "one_match_slot"]:
+            self.assertNotIn(check, errors)
+        infeasibility = sum(errors.to_lendict().values())
+        self.assertEqual(
+            output["log"]["cost"], cost(solver.get_objective(), infeasibility)
+        )
+        # neighbourhoods are built around the violations
+        rows = solver.solution.get_home_away_slot()
+        violations = solver.get_violations(rows)
+        self.assertGreater(len(violations), 0)
+        for key in violations:
+            teams, slots = solver.get_focus(key)
+            self.assertTrue(teams <= set(instance.get_teams()))
+            self.assertTrue(slots <= set(instance.slots))
+        rnd = random.Random(1)
+        for _ in range(20):
+            slots, teams = solver.get_neighbourhood(rows, rnd, dict(lnsSlots=3))
+            self.assertIn((len(slots), len(teams)), [(3, 0), (0, 3)])
+
+    def test_report(self):
+        path = os.path.join(os.path.dirname(__file__), "../data/ITC2021_Test3.xml")
+        instance = self.app.instance.from_xml(path)
+        solver = self.app.get_solver("round_robin")(instance)
+        solver.solve(dict(seed=1))
+        for constructor in [Experiment, DenseExperiment]:
+            experiment = constructor(instance, solver.solution)
+            report = experiment.get_report()
+            self.assertEqual(
+                report.take(["check", "type"]).unique2().len(), len(report)
+            )
+            soft = report.vfilter(lambda v: v["type"] == "SOFT")
+            self.assertEqual(sum(soft.take("penalty")), experiment.get_objective())
+            errors = experiment.check_solution().to_lendict()
+            hard = report.vfilter(lambda v: v["type"] == "HARD")
+            self.assertEqual(
+                {r["check"]: r["violations"] for r in hard if r["violations"]},
+                errors,
+            )
+            # profiling stops after the report
+            self.assertIsNone(experiment._profile)
+        config = dict(solver="round_robin", timeLimit=1, msg=False, report=True)
+        data = instance.to_dict()
+        solution, log_txt, log = self.app.solve(data, config)
+        self.assertEqual(
+            [r["check"] for r in log["report"] if r["type"] == "HARD"][-1],
+            "one_match_slot",
+        )
+
     def test_from_xml_from_json(self):
         tests = self.app.test_cases
         Instance = self.app.instance
@@ -125,6 +339,32 @@ class SportsSchedulingTest(BaseDAGTests.SolvingTests):
             instance = Instance.from_json(json_path)
             self.assertEqual(instance_data, instance.data)
 
+    def test_from_xml_stream(self):
+        path = os.path.join(os.path.dirname(__file__), "../data/ITC2021_Test3.xml")
+        instance = self.app.instance.from_xml(path)
+        with open(path, "rb") as f:
+            self.assertEqual(instance.data, self.app.instance.from_xml(f).data)
+        self.assertEqual(len(instance.get_teams()), 6)
+        self.assertEqual(len(instance.get_slots()), 10)
+        # constraints are enumerated per category, in the order of the file
+        constraints = instance.get_constraint("CA4")
+        self.assertEqual(constraints.keys_l(), list(range(44)))
+        self.assertEqual(constraints[0]["_cat"], "CA4")
+        self.assertIsInstance(constraints[0]["max"], int)
+
+    def test_from_dict_copy(self):
+        Instance = self.app.instance
+        for data in self.app.test_cases:
+            if isinstance(data, tuple):
+                data, data_out = data
+            original = tools.copy_dict(data)
+            instance = Instance.from_dict(data)
+            self.assertEqual(data, original)
+            self.assertEqual(instance.to_dict(), original)
+            # without copy, the data is parsed in place
+            instance_no_copy = Instance.from_dict(tools.copy_dict(data), copy=False)
+            self.assertEqual(instance.data, instance_no_copy.data)
+
     def test_solution_xml(self):
         second_test = self.app.test_cases[1]
         Instance = self.app.instance
@@ -135,6 +375,41 @@ class SportsSchedulingTest(BaseDAGTests.SolvingTests):
         )
         experiment.to_xml(self.tem_path + "asd.xml")
 
+    def test_solution_columns(self):
+        instance_data, solution_data = self.app.test_cases[1]
+        Solution = self.app.solution
+        original = tools.copy_dict(solution_data)
+        original["assignment"][0]["comment"] = "first"
+        solution = Solution.from_dict(tools.copy_dict(original))
+        self.assertEqual(solution.to_dict(), original)
+        self.assertEqual(len(solution), len(original["assignment"]))
+        rows = [(r["home"], r["away"], r["slot"]) for r in original["assignment"]]
+        self.assertEqual(solution.get_home_away_slot(), rows)
+        # the same solution from its rows, without the extra keys
+        from_rows = Solution.from_rows(rows)
+        self.assertEqual(from_rows.get_match_slot(), solution.get_match_slot())
+        self.assertEqual(from_rows.get_pair_slots(), solution.get_pair_slots())
+        index = self.app.instance.from_dict(instance_data).get_index()
+        positions = solution.get_positions(index.team_pos, index.slot_pos)
+        expected = [
+            (index.team_pos[home], index.team_pos[away], index.slot_pos[slot])
+            for home, away, slot in rows
+        ]
+        self.assertEqual(positions.tolist(), [list(row) for row in expected])
+        # a new data replaces the cached views
+        solution.data = dict(assignment=original["assignment"][:1])
+        self.assertEqual(solution.get_home_away_slot(), rows[:1])
+        self.assertRaises(KeyError, solution.get_positions, dict(), index.slot_pos)
+        # changes in place to data are seen by the views
+        solution = Solution.from_dict(tools.copy_dict(original))
+        self.assertEqual(solution.get_match_slot()[rows[0][:2]], rows[0][2])
+        solution.data["assignment"][0]["slot"] = rows[1][2]
+        solution.data["assignment"].append(dict(home="x", away="y", slot="z"))
+        self.assertEqual(len(solution), len(rows) + 1)
+        self.assertEqual(solution.get_match_slot()[rows[0][:2]], rows[1][2])
+        self.assertEqual(solution.get_home_away_slot()[-1], ("x", "y", "z"))
+        self.assertEqual(solution.get_assignment()[0]["comment"], "first")
+
     def test_check_solution(self):
         cases = [
             os.path.join(os.path.dirname(__file__), "../data/{}.xml".format(f))
@@ -148,3 +423,578 @@ class SportsSchedulingTest(BaseDAGTests.SolvingTests):
             errors = experiment.check_solution()
             errors = experiment.get_objective()
             pass
+
+    def test_check_GA1(self):
+        path = os.path.join(os.path.dirname(__file__), "../data/ITC2021_Test1.xml")
+        instance = self.app.instance.from_xml(path)
+        # meetings 2,1;3,2;4,5 in slots 7;8;1, max 1
+        k = instance.get_constraint("GA1").keys_tl()[0]
+        rows = [("2", "1", "7"), ("3", "2", "8"), ("4", "5", "1"), ("5", "4", "1")]
+        solution = self.app.solution.from_rows(rows)
+        experiment = Experiment(instance, solution)
+        errors = experiment.check_GA1()
+        self.assertEqual(errors[(k,)], 2)
+        self.assertEqual(DenseExperiment(instance, solution).check_GA1(), errors)
+        evaluator = IncrementalEvaluator(experiment)
+        hard = experiment.check_solution()["GA1"]
+        self.assertEqual(evaluator.check_solution()["GA1"], hard)
+        # after the move, only one of the meetings is in the slots
+        evaluator.apply(evaluator.move_match("2", "1", "2"))
+        evaluator.apply(evaluator.move_match("3", "2", "2"))
+        self.assertNotIn((k,), evaluator.check_solution().get("GA1", {}))
+
+    def test_pair_slots(self):
+        Solution = self.app.solution
+        assignment = [
+            dict(home="0", away="1", slot="12"),
+            dict(home="1", away="0", slot="3"),
+        ]
+        solution = Solution.from_dict(dict(assignment=assignment))
+        # slot ids with more than one character are kept whole
+        self.assertEqual(solution.get_pair_slots(), {("0", "1"): ["12", "3"]})
+
+    def test_incremental_evaluator(self):
+        cases = [
+            os.path.join(os.path.dirname(__file__), "../data/{}.xml".format(f))
+            for f in ["ITC2021_Test1", "ITC2021_Test2", "ITC2021_Test3"]
+        ]
+        Experiment = self.app.get_solver("default")
+        rand = random.Random(42)
+        for filename in cases:
+            instance = self.app.instance.from_xml(filename)
+            experiment = Experiment(instance)
+            experiment.solve({})
+            evaluator = IncrementalEvaluator(experiment)
+            slots = list(instance.slots)
+            for _ in range(30):
+                pair = rand.choice(list(evaluator.pair_slot))
+                move = rand.choice(
+                    [
+                        evaluator.swap_slots(*rand.sample(slots, 2)),
+                        evaluator.swap_home_away(*pair),
+                        evaluator.move_match(*pair, rand.choice(slots)),
+                    ]
+                )
+                delta = evaluator.delta(move)
+                self.assertEqual(delta, evaluator.apply(move))
+                experiment = Experiment(instance, evaluator.get_solution())
+                errors = experiment.check_solution()
+                self.assertEqual(errors, evaluator.check_solution())
+                self.assertEqual(
+                    sum(errors.to_lendict().values()), evaluator.infeasibility
+                )
+                self.assertEqual(experiment.get_objective(), evaluator.objective)
+
+    def test_evaluator_neighbourhoods(self):
+        from hackathonbaobab2021.solver.annealing import Annealing
+
+        rand = random.Random(3)
+        for f in ["ITC2021_Test1", "ITC2021_Test2", "ITC2021_Test3"]:
+            path = os.path.join(os.path.dirname(__file__), "../data/{}.xml".format(f))
+            instance = self.app.instance.from_xml(path)
+            experiment = self.app.get_solver("round_robin")(instance)
+            experiment.solve(dict(seed=1))
+            evaluator = IncrementalEvaluator(experiment)
+            neighbours = Annealing.get_neighbours(evaluator, rand)
+            for _ in range(50):
+                move = rand.choice(neighbours)()
+                if move is None:
+                    continue
+                self.assertEqual(evaluator.delta(move), evaluator.apply(move))
+                experiment = Experiment(instance, evaluator.get_solution())
+                errors = experiment.check_solution()
+                # all neighbourhoods keep a double round robin
+                for check in ["num_home", "num_away", "one_match_slot"]:
+                    self.assertNotIn(check, errors)
+                self.assertEqual(errors, evaluator.check_solution())
+                self.assertEqual(experiment.get_objective(), evaluator.objective)
+
+    def test_evaluator_throughput(self):
+        from timeit import default_timer as timer
+
+        path = os.path.join(os.path.dirname(__file__), "../data/ITC2021_Test3.xml")
+        instance = self.app.instance.from_xml(path)
+        experiment = self.app.get_solver("round_robin")(instance)
+        experiment.solve(dict(seed=1))
+        evaluator = IncrementalEvaluator(experiment)
+        rand = random.Random(1)
+        # a move only evaluates again the parts of its teams
+        home, away = rand.choice(list(evaluator.pair_slot))
+        removed, added = evaluator.swap_home_away(home, away)
+        for key in evaluator._touched(removed + added):
+            if key[0] in ["CA1", "CA2", "CA3", "BR1"]:
+                self.assertIn(key[2], {home, away})
+            elif key[0] in ["SE1", "FA2"]:
+                self.assertTrue({home, away} & set(key[2]))
+        # it used to be around 400 moves per second
+        start = timer()
+        moves = 0
+        while timer() - start < 1:
+            evaluator.delta(evaluator.swap_home_away(*rand.sample(evaluator.teams, 2)))
+            moves += 1
+        self.assertGreater(moves, 1000)
+
+    def test_annealing(self):
+        self.test_try_solving_testcase(
+            dict(solver="annealing", timeLimit=1, msg=False, seed=1)
+        )
+        path = os.path.join(os.path.dirname(__file__), "../data/ITC2021_Test2.xml")
+        instance = self.app.instance.from_xml(path)
+        initial = self.app.get_solver("round_robin")(instance)
+        initial.solve(dict(seed=1))
+        solver = self.app.get_solver("annealing")(instance, initial.solution)
+        solver.solve(dict(timeLimit=2, seed=1, warmStart=True))
+        self.assertEqual(solver.check_solution(), {})
+        self.assertLess(solver.get_objective(), initial.get_objective())
+
+    def test_annealing_warm_start(self):
+        from hackathonbaobab2021.solver.round_robin import is_double_round_robin
+
+        for f in ["ITC2021_Test1", "ITC2021_Test2", "ITC2021_Test3"]:
+            path = os.path.join(os.path.dirname(__file__), "../data/{}.xml".format(f))
+            instance = self.app.instance.from_xml(path)
+            default = self.app.get_solver("default")(instance)
+            default.solve({})
+            initial = self.app.get_solver("round_robin")(instance)
+            initial.solve(dict(seed=1))
+            rows = initial.solution.get_home_away_slot()
+            self.assertTrue(is_double_round_robin(instance, rows))
+            # a pair that meets twice with the same venues
+            (home, away, slot), second = rows[0], rows[1]
+            broken = [(away, home, slot), (second[1], second[0], second[2])]
+            broken = self.app.solution.from_rows(broken + rows[2:])
+            self.assertFalse(
+                is_double_round_robin(instance, broken.get_home_away_slot())
+            )
+            for solution in [None, default.solution, broken]:
+                solver = self.app.get_solver("annealing")(instance, solution)
+                solver.solve(dict(timeLimit=0.5, seed=1, warmStart=True))
+                rows = solver.solution.get_home_away_slot()
+                self.assertTrue(is_double_round_robin(instance, rows))
+
+    def test_dense_checks(self):
+        cases = [
+            os.path.join(os.path.dirname(__file__), "../data/{}.xml".format(f))
+            for f in ["ITC2021_Test1", "ITC2021_Test2", "ITC2021_Test3"]
+        ]
+        rand = random.Random(42)
+        for filename in cases:
+            instance = self.app.instance.from_xml(filename)
+            experiment = self.app.get_solver("default")(instance)
+            experiment.solve({})
+            evaluator = IncrementalEvaluator(experiment)
+            for _ in range(10):
+                slots = rand.sample(list(instance.slots), 2)
+                evaluator.apply(evaluator.swap_slots(*slots))
+                evaluator.apply(
+                    evaluator.swap_home_away(*rand.choice(list(evaluator.pair_slot)))
+                )
+                solution = evaluator.get_solution()
+                experiment = Experiment(instance, solution)
+                dense = DenseExperiment(instance, solution)
+                for c_type in ["HARD", "SOFT"]:
+                    self.assertEqual(
+                        experiment.check_solution(c_type=c_type),
+                        dense.check_solution(c_type=c_type),
+                    )
+                self.assertEqual(experiment.get_objective(), dense.get_objective())
+                # the break matrix has the same breaks as count_breaks
+                index = instance.get_index()
+                breaks = experiment.get_breaks()
+                self.assertEqual(
+                    {
+                        (index.teams[t], index.slots[s]): (
+                            "H" if breaks[t, s] > 0 else "A"
+                        )
+                        for t, s in zip(*breaks.nonzero())
+                    },
+                    dict(experiment.count_breaks()),
+                )
+
+    def test_constraint_index(self):
+        path = os.path.join(os.path.dirname(__file__), "../data/ITC2021_Test1.xml")
+        instance = self.app.instance.from_xml(path)
+        index = instance.get_index()
+        self.assertIs(index, instance.get_index())
+        num_slots = len(instance.slots)
+        for k, c in instance.get_constraint("CA3").items():
+            windows = index.get("CA3", k)["windows"]
+            self.assertEqual(len(windows), num_slots - c["intp"] + 1)
+            self.assertTrue(all(len(v) == c["intp"] for v in windows.values()))
+        for k, c in instance.get_constraint("CA1").items():
+            compiled = index.get("CA1", k)
+            self.assertEqual(compiled["teams_mask"].sum(), len(set(c["teams"])))
+            positions = [index.slot_pos[s] for s in c["slots"]]
+            self.assertEqual(sorted(set(positions)), compiled["slots_pos"].tolist())
+        # the windows of CA3 are answered with prefix sums
+        values = np.arange(12).reshape(2, 6) % 4
+        for intp in [1, 3, 6]:
+            self.assertEqual(
+                window_sums(values, intp).tolist(),
+                [
+                    [sum(row[p : p + intp]) for p in range(len(row) - intp + 1)]
+                    for row in values.tolist()
+                ],
+            )
+        # counting in a bitset is the same as intersecting the sets
+        experiment = self.app.get_solver("round_robin")(instance)
+        experiment.solve(dict(seed=1))
+        matches = experiment.solution.get_home_away_slot().to_set()
+        bits = index.to_bits(matches)
+        self.assertEqual(tools.popcount(bits), len(matches))
+        for k, c in instance.get_constraint("CA4").items():
+            check = apply_mode(get_matches_slots_constraint(c), mode=c["mode2"])
+            found = index.get("CA4", k)["matches_bits"] & bits
+            self.assertEqual(tools.popcount(found), len(check.to_set() & matches))
+            slot = c["slots"][0]
+            self.assertEqual(
+                tools.popcount(found & index.get_slot_bits()[slot]),
+                len([m for m in check.to_set() & matches if m[2] == slot]),
+            )
+
+    def _make_batch(self, name="batch"):
+        """
+        writes a batch with two scenarios of the ITC2021 test instances
+        solved with the default solver and returns its path.
+        """
+        path = os.path.join(self.tem_path, name)
+        self.addCleanup(shutil.rmtree, path, ignore_errors=True)
+        Experiment = self.app.get_solver("default")
+        for scenario in ["scenario1", "scenario2"]:
+            for instance_name in ["ITC2021_Test1", "ITC2021_Test2", "ITC2021_Test3"]:
+                filename = os.path.join(
+                    os.path.dirname(__file__), "../data/{}.xml".format(instance_name)
+                )
+                experiment = Experiment(self.app.instance.from_xml(filename))
+                experiment.solve({})
+                directory = os.path.join(path, scenario, instance_name)
+                os.makedirs(directory)
+                experiment.instance.to_json(os.path.join(directory, "input.json"))
+                experiment.solution.to_json(os.path.join(directory, "output.json"))
+                options = dict(solver="default", timeLimit=1)
+                tools.write_json(options, os.path.join(directory, "options.json"))
+        return path
+
+    def _make_zip_batch(self, name="batch"):
+        path = self._make_batch(name)
+        # the zip is removed in tearDown
+        return shutil.make_archive(path, "zip", root_dir=self.tem_path, base_dir=name)
+
+    def test_batch_workers(self):
+        path = self._make_batch()
+        zip_path = self._make_zip_batch("batch_zip")
+        for constructor, _path in [(Batch, path), (ZipBatch, zip_path)]:
+            serial = constructor(_path)
+            parallel = constructor(_path, workers=2)
+            self.assertEqual(len(serial.get_errors()), 6)
+            self.assertEqual(serial.get_errors(), parallel.get_errors())
+            self.assertEqual(
+                serial.get_objective_function(), parallel.get_objective_function()
+            )
+
+    def test_solve_zip_workers(self):
+        from hackathonbaobab2021.execution.run_batch import solve_zip
+
+        names = ["ITC2021_Test{}.xml".format(i) for i in range(1, 4)]
+        zip_path = os.path.join(self.tem_path, "instances.zip")
+        with zipfile.ZipFile(zip_path, "w") as zip_obj:
+            for name in names:
+                path = os.path.join(os.path.dirname(__file__), "../data", name)
+                zip_obj.write(path, name)
+        options = dict(timeLimit=10)
+        for workers in [1, 2]:
+            path_out = os.path.join(self.tem_path, "out{}".format(workers))
+            self.addCleanup(shutil.rmtree, path_out)
+            solve_zip(
+                "instances.zip",
+                path_out,
+                path_in=self.tem_path,
+                options=options,
+                workers=workers,
+            )
+            for name in names:
+                experiment_dir = os.path.join(path_out, "instances", name)
+                self.assertEqual(
+                    sorted(os.listdir(experiment_dir)),
+                    ["input.json", "options.json", "output.json"],
+                )
+                log = tools.load_data(os.path.join(experiment_dir, "options.json"))
+                self.assertIn("time", log)
+
+    def test_batch_stream(self):
+        from hackathonbaobab2021.execution.run_batch import get_table
+
+        zip_path = self._make_zip_batch("batch_stream")
+        for workers in [None, 2]:
+            batch = ZipBatch(zip_path, workers=workers)
+            metrics = dict(batch.iter_metrics())
+            self.assertIsNone(batch.cases)
+            self.assertEqual(
+                metrics,
+                {
+                    k: dict(objective=v, errors=batch.get_errors()[k])
+                    for k, v in batch.get_objective_function().items()
+                },
+            )
+            table = get_table(zip_path, workers=workers)
+            self.assertEqual(len(table), 6)
+            # the options, except the log of the solver, go before the errors
+            self.assertEqual(
+                list(table.columns),
+                ["scenario", "name", "objective", "solver", "timeLimit", "errors"],
+            )
+            self.assertEqual(
+                table.set_index(["scenario", "name"]).objective.to_dict(),
+                {k: v["objective"] for k, v in metrics.items()},
+            )
+        keys = [k for k, _ in ZipBatch(zip_path).iter_cases()]
+        self.assertEqual(sorted(keys), sorted(ZipBatch(zip_path).get_cases().keys()))
+
+    def test_zip_index(self):
+        zip_path = self._make_zip_batch("batch_index")
+        batch = ZipBatch(zip_path)
+        with patch("zipfile.ZipFile", wraps=zipfile.ZipFile) as zip_file:
+            paths = batch.get_instances_paths()
+            batch.get_options()
+            batch.get_cases()
+            batch.get_logs()
+            self.assertEqual(zip_file.call_count, 1)
+        self.assertEqual(
+            paths["scenario1", "ITC2021_Test1"], "batch_index/scenario1/ITC2021_Test1"
+        )
+        self.assertEqual(len(paths), 6)
+        self.assertEqual(len(batch.get_members("options.json")), 6)
+        self.assertEqual(len(batch.get_members("results.log")), 0)
+        batch = ZipBatch(zip_path, scenarios=["scenario2"])
+        self.assertEqual(len(batch.get_json("input.json")), 3)
+        batch.close()
+
+    def test_metrics_cache(self):
+        from hackathonbaobab2021.core import MetricsCache
+
+        path = self._make_batch("batch_metrics")
+        zip_path = self._make_zip_batch("batch_metrics_zip")
+        for constructor, _path in [(Batch, path), (ZipBatch, zip_path)]:
+            expected = dict(constructor(_path).iter_metrics())
+            cache = MetricsCache(os.path.join(self.tem_path, "metrics.sqlite3"))
+            batch = constructor(_path, metrics_cache=cache)
+            self.assertEqual(dict(batch.iter_metrics()), expected)
+            self.assertEqual((cache.hits, cache.misses), (0, 6))
+            # the second time nothing is evaluated
+            with patch.object(Experiment, "check_solution") as check_solution:
+                self.assertEqual(dict(batch.iter_metrics()), expected)
+                check_solution.assert_not_called()
+            self.assertEqual((cache.hits, cache.misses), (6, 6))
+            reports = dict(batch.iter_metrics(report=True))
+            key = "scenario1", "ITC2021_Test1"
+            self.assertEqual(
+                sum(r["penalty"] for r in reports[key]["report"]),
+                expected[key]["objective"],
+            )
+            cache.close()
+            os.remove(cache.path)
+        # only the experiment that changed is evaluated again
+        cache = MetricsCache(os.path.join(self.tem_path, "metrics.sqlite3"))
+        self.addCleanup(cache.close)
+        batch = Batch(path, metrics_cache=cache)
+        dict(batch.iter_metrics())
+        output = os.path.join(path, "scenario1", "ITC2021_Test2", "output.json")
+        solution = tools.load_data(output)
+        solution["assignment"] = solution["assignment"][1:]
+        tools.write_json(solution, output)
+        metrics = dict(batch.iter_metrics())
+        self.assertEqual((cache.hits, cache.misses), (5, 7))
+        self.assertGreater(metrics["scenario1", "ITC2021_Test2"]["errors"], 0)
+        # the least recently used entries are removed
+        cache.max_entries = 2
+        cache.set("new", dict(objective=0, errors=0))
+        self.assertEqual(len(cache), 2)
+        self.assertIsNotNone(cache.get("new"))
+        cache.set_many([("a", dict(objective=1)), ("b", dict(objective=2))])
+        self.assertEqual(
+            cache.get_many(["a", "b", "c"]),
+            dict(a=dict(objective=1), b=dict(objective=2)),
+        )
+        # the metrics of another version of the checks are not used
+        key = MetricsCache.get_key("content")
+        with patch("hackathonbaobab2021.core.cache.CHECKS_VERSION", "other"):
+            self.assertNotEqual(MetricsCache.get_key("content"), key)
+
+    def _make_log_batch(self, name="out_logs"):
+        """
+        solves ITC2021_Test2 with cpsat in two scenarios and returns the path
+        of the batch. Each experiment has a results.log.
+        """
+        from hackathonbaobab2021.execution.run_batch import solve_zip
+
+        instance_name = "ITC2021_Test2.xml"
+        path_out = os.path.join(self.tem_path, name)
+        self.addCleanup(shutil.rmtree, path_out)
+        # one scenario per zip of instances
+        for scenario in ["scenario1", "scenario2"]:
+            zip_path = os.path.join(self.tem_path, scenario + ".zip")
+            with zipfile.ZipFile(zip_path, "w") as zip_obj:
+                zip_obj.write(
+                    os.path.join(os.path.dirname(__file__), "../data", instance_name),
+                    instance_name,
+                )
+            solve_zip(
+                scenario + ".zip",
+                path_out,
+                path_in=self.tem_path,
+                solver_name="cpsat",
+                options=dict(timeLimit=10, threads=1),
+            )
+        return path_out
+
+    def test_logs_cache(self):
+        from hackathonbaobab2021.core import batch as batch_module
+
+        path = self._make_log_batch()
+        zip_path = shutil.make_archive(
+            path, "zip", root_dir=self.tem_path, base_dir="out_logs"
+        )
+        cache_dir = os.path.join(self.tem_path, "logs_cache")
+        self.addCleanup(shutil.rmtree, cache_dir)
+        for constructor, _path in [(Batch, path), (ZipBatch, zip_path)]:
+            expected = constructor(_path).get_logs()
+            self.assertEqual(len(expected), 2)
+            for workers in [None, 2]:
+                batch = constructor(_path, workers=workers, logs_cache=cache_dir)
+                logs = batch.get_logs()
+                self.assertEqual(logs.keys_tl(), expected.keys_tl())
+                for key, log in logs.items():
+                    self.assertEqual(
+                        log["best_solution"], expected[key]["best_solution"]
+                    )
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+            # the second time, the logs are not parsed again
+            with patch.object(batch_module.ol, "get_info_solver") as get_info:
+                constructor(_path, logs_cache=cache_dir).get_logs()
+                get_info.assert_not_called()
+        # by default, the cache is next to the batch
+        batch = Batch(path, logs_cache=True)
+        self.assertEqual(batch.get_logs_cache().directory, path + ".logs")
+        self.addCleanup(shutil.rmtree, path + ".logs", ignore_errors=True)
+        # progress tables are only parsed for the experiments asked for
+        key = "scenario1", "ITC2021_Test2.xml"
+        get_info_solver = batch_module.ol.get_info_solver
+
+        def get_info(path, solver, get_progress=False, **kwargs):
+            log = get_info_solver(path, solver, get_progress=False, **kwargs)
+            log["progress"] = "parsed" if get_progress else None
+            return log
+
+        with patch.object(batch_module.ol, "get_info_solver", side_effect=get_info):
+            progress = Batch(path).get_progress([key])
+        self.assertEqual(progress, {key: "parsed"})
+
+    def test_export_dataset(self):
+        from hackathonbaobab2021.execution import run_batch as rb
+
+        try:
+            import pyarrow
+        except ImportError:
+            self.skipTest("pyarrow is an optional requirement (export)")
+        if int(pyarrow.__version__.split(".")[0]) < 14:
+            self.skipTest("read_dataset needs pyarrow>=14")
+
+        self._make_log_batch("out_export")
+        archive = lambda base_dir: shutil.make_archive(
+            os.path.join(self.tem_path, "results"),
+            "zip",
+            root_dir=self.tem_path,
+            base_dir=base_dir,
+        )
+        for file_format in ["parquet", "feather"]:
+            path = os.path.join(self.tem_path, "export_" + file_format)
+            self.addCleanup(shutil.rmtree, path)
+            rb.export_batch(archive("out_export/scenario1"), path, file_format)
+            table = rb.read_dataset(os.path.join(path, "table"), file_format)
+            self.assertEqual(table.scenario.tolist(), ["scenario1"])
+            # new scenarios are added, the ones in the zip are replaced
+            zip_path = archive("out_export")
+            rb.export_batch(zip_path, path, file_format)
+            rb.export_batch(zip_path, path, file_format)
+            table = rb.read_dataset(os.path.join(path, "table"), file_format)
+            expected = rb.get_table(zip_path)
+            # the log of the solver in options.json is not a column
+            self.assertNotIn("log", expected.columns)
+            self.assertIn("status", expected.columns)
+            self.assertEqual(expected.columns[-1], "errors")
+            self.assertEqual(
+                table.sort_values("scenario").objective.tolist(),
+                expected.sort_values("scenario").objective.tolist(),
+            )
+            status = rb.read_dataset(os.path.join(path, "status"), file_format)
+            self.assertEqual(sorted(status.scenario), ["scenario1", "scenario2"])
+            self.assertEqual(status.status.tolist(), ["Optimal", "Optimal"])
+            log = rb.read_dataset(os.path.join(path, "log"), file_format)
+            self.assertEqual(log.best_solution.tolist(), [320, 320])
+
+    def test_benchmark(self):
+        from hackathonbaobab2021.execution import benchmark
+
+        path = os.path.join(os.path.dirname(__file__), "../data/ITC2021_Test1.xml")
+        instance = self.app.instance.from_xml(path)
+        scaled = benchmark.scale_instance(instance, 3)
+        self.assertEqual(
+            benchmark.get_size(scaled), dict(teams=18, slots=34, constraints=183)
+        )
+        solver = self.app.get_solver("default")(scaled)
+        solver.solve({})
+        experiment = Experiment(scaled, solver.solution)
+        dense = DenseExperiment(scaled, solver.solution)
+        self.assertEqual(experiment.check_solution(), dense.check_solution())
+        self.assertEqual(experiment.get_objective(), dense.get_objective())
+        output = os.path.join(self.tem_path, "benchmark.json")
+        benchmark.run_benchmark(["ITC2021_Test1"], factors=[2], repeat=1, output=output)
+        result = tools.load_data(output)["instances"]
+        self.assertEqual(set(result), {"ITC2021_Test1", "ITC2021_Test1_x2"})
+        self.assertIn("from_xml", result["ITC2021_Test1"]["times"])
+        self.assertIn("Experiment.check_CA3", result["ITC2021_Test1_x2"]["times"])
+
+    def test_convert_instances(self):
+        from hackathonbaobab2021.execution.convert_instances import convert_instances
+
+        data_dir = os.path.join(os.path.dirname(__file__), "../data")
+        names = ["ITC2021_Test{}".format(i) for i in range(1, 4)]
+        source = os.path.join(self.tem_path, "xml")
+        os.makedirs(source, exist_ok=True)
+        self.addCleanup(shutil.rmtree, source)
+        for name in names:
+            shutil.copy(os.path.join(data_dir, name + ".xml"), source)
+        zip_path = shutil.make_archive(source, "zip", root_dir=source)
+        cache_dir = os.path.join(self.tem_path, "cache")
+        self.addCleanup(shutil.rmtree, cache_dir)
+        for _source, workers in [(source, None), (zip_path, 2)]:
+            path_out = os.path.join(self.tem_path, "json")
+            self.addCleanup(shutil.rmtree, path_out, ignore_errors=True)
+            paths = convert_instances(
+                _source, path_out, workers=workers, cache_dir=cache_dir
+            )
+            self.assertEqual(len(paths), 3)
+            for name, path in zip(names, paths):
+                instance = self.app.instance.from_xml(
+                    os.path.join(data_dir, name + ".xml")
+                )
+                self.assertEqual(tools.load_data(path), instance.to_dict())
+        self.assertEqual(len(os.listdir(cache_dir)), 3)
+
+    def test_from_xml_cache(self):
+        path = os.path.join(os.path.dirname(__file__), "../data/ITC2021_Test1.xml")
+        cache_dir = os.path.join(self.tem_path, "cache_xml")
+        self.addCleanup(shutil.rmtree, cache_dir)
+        Instance = self.app.instance
+        instance = Instance.from_xml(path, cache_dir=cache_dir)
+        with patch.object(Instance, "read_xml") as read_xml:
+            cached = Instance.from_xml(path, cache_dir=cache_dir)
+            read_xml.assert_not_called()
+        self.assertEqual(instance.data, cached.data)
+        self.assertEqual(instance.data, Instance.from_xml(path).data)
+        # a different content is a different entry
+        with open(path, "rb") as f:
+            content = f.read().replace(b'penalty="1"', b'penalty="2"', 1)
+        changed = Instance.from_xml(io.BytesIO(content), cache_dir=cache_dir)
+        self.assertNotEqual(instance.data, changed.data)
+        self.assertEqual(len(os.listdir(cache_dir)), 2)
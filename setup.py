@@ -14,10 +14,11 @@ packages = [
 with open("README.md", "r") as fh:
     long_description = fh.read()
 
-install_requires = ["pytups", "click", "pandas", "orloge", "cornflow_client"]
+install_requires = ["pytups", "click", "pandas", "numpy", "orloge", "cornflow_client"]
 
 extras_require = {
     "solvers": ["pyomo", "ortools"],
+    "export": ["pyarrow>=14"],
 }
 
 kwargs = {